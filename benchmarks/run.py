@@ -0,0 +1,302 @@
+"""
+Benchmarks of the module functions and of a scripted app rerun, on synthetic Superstore versions.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run --rows 10000 100000 1000000
+    python -m benchmarks.run --rows 10000 --app --output benchmarks/results/before.json
+
+Results are written as JSON (one record per benchmark and size) so runs of different commits can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from modules import module as mod
+from benchmarks.synthetic import generate_superstore
+
+SYNTHETIC_VERSION = 'Synthetic.csv'
+
+
+def _reset_peak_rss():
+    """
+    Resets the peak resident memory of the process (Linux only). Returns False if it cannot be reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    """
+    Returns the peak resident memory of the process in MB, since the last reset where supported.
+    """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if platform.system() == 'Darwin' else peak / 1024  # bytes on macOS, KB elsewhere
+
+
+def measure(fn, setup=None, repeat=3):
+    """
+    Description: Times a call and records its peak memory. The best wall time of `repeat` runs is kept; the peak
+    memory is taken from one extra run under `tracemalloc`, so tracing does not distort the timings. Tracing only
+    sees Python allocations (not those of Arrow), so the growth of the peak resident memory of the process during
+    that run is recorded too, which also counts the pages of memory-mapped files.
+
+    Parameters:
+    - `fn` (callable): The function to benchmark. It receives the result of `setup`, if any.
+    - `setup` (callable, optional): Builds the argument of `fn` before each run (not timed).
+    - `repeat` (int): The number of timed runs. Default is 3.
+
+    Return:
+    - `result` (dict): `'seconds'` (best wall time), `'peak_mb'` (peak traced memory in MB) and `'peak_rss_mb'`
+    (growth of the peak resident memory in MB: pages freed earlier and reused by the run are not counted, and
+    where the peak cannot be reset, only growth above earlier peaks).
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else None
+        start = time.perf_counter()
+        fn(args) if setup else fn()
+        times.append(time.perf_counter() - start)
+
+    args = setup() if setup else None
+    rss_before = _peak_rss_mb() if not _reset_peak_rss() else mod._memory_mb()
+    tracemalloc.start()
+    fn(args) if setup else fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': min(times), 'peak_mb': peak / 2 ** 20, 'peak_rss_mb': max(0.0, _peak_rss_mb() - rss_before)}
+
+
+def scripted_rerun(file_name, year, product_level, product_name, geography_level, geography_name, spec):
+    """
+    Description: Runs the pipeline of `main.py` for one set of selector and lever values, without Streamlit:
+    load, selectors, selection, simulation and both summary tables.
+
+    Return:
+    - `tables` (tuple): The selection and total output tables.
+    """
+    dim_index = mod.version_dimension_index(file_name)
+
+    mod.dimension_options(dim_index, 'Order Year')
+    filters = [('Order Year', year)]
+    positions = mod.dimension_positions(dim_index, filters)
+    mod.select_dimension_name(dim_index, product_level, positions)
+    if product_level != 'All':
+        filters.append((product_level, product_name))
+        positions = mod.dimension_positions(dim_index, filters)
+    mod.select_dimension_name(dim_index, geography_level, positions)
+    if geography_level != 'All':
+        filters.append((geography_level, geography_name))
+        positions = mod.dimension_positions(dim_index, filters)
+    baseline_totals = mod.cube_totals(file_name, filters, 'Baseline')
+    simulation = mod.simulation_overlay(file_name, positions, spec)
+    change = mod.overlay_change(simulation)
+    selection = [mod.summary_metrics(baseline_totals),
+                 mod.summary_metrics(mod.apply_totals_change(baseline_totals, change, 'Simulation'))]
+
+    grand_totals = mod.cube_totals(file_name, [('Order Year', year)], 'Baseline')
+    total = [mod.summary_metrics(grand_totals),
+             mod.summary_metrics(mod.apply_totals_change(grand_totals, change, 'Simulation'))]
+    return selection, total
+
+
+def app_rerun(main_path, data_dir):
+    """
+    Description: Runs `main.py` end-to-end with Streamlit's `AppTest`, on a data folder with the synthetic
+    version registered, and reruns it after changing the Year selector.
+
+    Return:
+    - `result` (dict): `'first_run_seconds'` and `'rerun_seconds'`.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(data_dir))
+    try:
+        start = time.perf_counter()
+        app = AppTest.from_file(main_path, default_timeout=600).run()
+        first = time.perf_counter() - start
+
+        year = app.selectbox(key='Year').options[-1]
+        start = time.perf_counter()
+        app.selectbox(key='Year').set_value(int(year)).run()
+        rerun = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+
+    if app.exception:
+        raise RuntimeError(f'main.py failed: {app.exception}')
+    return {'first_run_seconds': first, 'rerun_seconds': rerun}
+
+
+def run_benchmarks(rows, repeat=3, app=False, products=None, postal_codes=None, customers=None, seed=0):
+    """
+    Description: Generates a synthetic version of the given size and benchmarks the module functions, the dataset
+    store and a scripted rerun of the app on it.
+
+    Parameters:
+    - `rows` (int): The number of order lines of the synthetic version.
+    - `repeat` (int): The number of timed runs per benchmark. Default is 3.
+    - `app` (bool): Also run `main.py` end-to-end with Streamlit's `AppTest`. Default is False.
+    - `products`, `postal_codes`, `customers` (int, optional): Cardinalities of the synthetic version. By default
+    they grow with the number of rows, starting from those of the sample.
+    - `seed` (int): The seed of the generator. Default is 0.
+
+    Return:
+    - `records` (list): One dictionary per benchmark.
+    """
+    scale = max(1.0, rows / 10000) ** 0.5
+    products = products or int(1800 * scale)
+    postal_codes = postal_codes or int(630 * scale)
+    customers = customers or int(800 * scale)
+
+    start = time.perf_counter()
+    df = generate_superstore(rows, products=products, postal_codes=postal_codes, customers=customers, seed=seed)
+    generate_seconds = time.perf_counter() - start
+
+    records = []
+
+    def record(name, result):
+        records.append({'benchmark': name, 'rows': rows, 'products': products, 'postal_codes': postal_codes,
+                        **result})
+        print(f"{name:<28} {rows:>10,} rows  {result.get('seconds', float('nan')):9.4f} s"
+              f"  {result.get('peak_mb', float('nan')):9.1f} MB"
+              f"  {result.get('peak_rss_mb', float('nan')):9.1f} MB RSS")
+
+    record('generate_superstore', {'seconds': generate_seconds})
+
+    year = int(df['Order Year'].max())
+    category = df['Category'].iloc[0]
+    region = df['Region'].iloc[0]
+    changed = df.sample(frac=0.1, random_state=seed)
+    spec = {'List Price': ('Increase in %', 5.0), 'Discount': ('Max Treshold %', 20.0)}
+    sweep_rows = df[df['Order Year'] == year]
+
+    record('fill_selector', measure(lambda: mod.fill_selector(df, 'Product ID'), repeat=repeat))
+    record('apply_filter', measure(lambda: mod.apply_filter(mod.apply_filter(mod.apply_filter(
+        df, 'Order Year', year), 'Category', category), 'Region', region), repeat=repeat))
+    record('profit_calc', measure(lambda d: mod.profit_calc(d, mod.SIMULATION_COLUMNS),
+                                  setup=lambda: df.copy(), repeat=repeat))
+    record('gross_margin_calc', measure(lambda d: mod.gross_margin_calc(d, mod.SIMULATION_COLUMNS),
+                                        setup=lambda: df.copy(), repeat=repeat))
+    record('summary_tab', measure(lambda: mod.summary_tab(df, 'Baseline', 'All'), repeat=repeat))
+    record('insert_changes', measure(lambda: mod.insert_changes(df, changed), repeat=repeat))
+    record('run_simulation', measure(lambda: mod.run_simulation(df, spec), repeat=repeat))
+    record('scenario_sweep_100', measure(lambda: mod.scenario_sweep(sweep_rows, list_price_pct=range(-5, 5),
+                                                                    discount_cap=range(0, 100, 10)),
+                                         repeat=1))
+    record('build_dimension_index', measure(lambda: mod.build_dimension_index(df), repeat=repeat))
+    record('build_cube', measure(lambda: mod.build_cube(df), repeat=repeat))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, 'data')
+        os.makedirs(data_dir)
+        df.to_csv(os.path.join(data_dir, SYNTHETIC_VERSION), index=False)
+        mod.save_list_to_csv([SYNTHETIC_VERSION], os.path.join(data_dir, 'simulations_list.csv'))
+
+        data_dir_before, store_dir_before = mod.DATA_DIR, mod.STORE_DIR
+        mod.DATA_DIR, mod.STORE_DIR = data_dir, os.path.join(data_dir, '.store')
+        try:
+            def remove_store_copy():
+                # Every run converts again (the dimension tables of earlier runs are reused)
+                mod._version_cache.clear()
+                path = mod.store_path(SYNTHETIC_VERSION)
+                if os.path.exists(path):
+                    os.remove(path)
+
+            record('convert_version', measure(lambda _: mod.convert_version(SYNTHETIC_VERSION),
+                                              setup=remove_store_copy, repeat=1))
+            record('load_version_cold', measure(lambda: (mod._version_cache.clear(),
+                                                         mod.load_version(SYNTHETIC_VERSION)), repeat=repeat))
+            record('load_version_warm', measure(lambda: mod.load_version(SYNTHETIC_VERSION), repeat=repeat))
+            record('scripted_rerun_cold', measure(lambda: (mod._version_cache.clear(), scripted_rerun(
+                SYNTHETIC_VERSION, year, 'Category', category, 'Region', region, spec)), repeat=1))
+            record('scripted_rerun_warm', measure(lambda: scripted_rerun(
+                SYNTHETIC_VERSION, year, 'Category', category, 'Region', region, spec), repeat=repeat))
+
+            # A daily batch of 1% new order lines, with new Row IDs on each run
+            batch = df.sample(frac=0.01, random_state=seed)
+
+            def new_batch():
+                start = int(mod.version_row_index(SYNTHETIC_VERSION).max()) + 1
+                return batch.assign(**{'Row ID': np.arange(start, start + len(batch))})
+
+            record('append_version', measure(lambda b: mod.append_version(SYNTHETIC_VERSION, b), setup=new_batch,
+                                             repeat=repeat))
+        finally:
+            mod.DATA_DIR, mod.STORE_DIR = data_dir_before, store_dir_before
+            mod._version_cache.clear()
+
+        if app:
+            main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'main.py'))
+            result = app_rerun(main_path, data_dir)
+            record('app_first_run', {'seconds': result['first_run_seconds']})
+            record('app_rerun', {'seconds': result['rerun_seconds']})
+
+    return records
+
+
+def git_commit():
+    """
+    Returns the current git commit hash, or 'unknown' outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Superstore simulation pipeline on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                        help='sizes of the synthetic versions (default: 10000 100000)')
+    parser.add_argument('--products', type=int, help='number of products (default: grows with rows)')
+    parser.add_argument('--postal-codes', type=int, help='number of postal codes (default: grows with rows)')
+    parser.add_argument('--customers', type=int, help='number of customers (default: grows with rows)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark (default: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generator (default: 0)')
+    parser.add_argument('--app', action='store_true', help='also run main.py end-to-end with AppTest')
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/<commit>.json)')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    records = []
+    for rows in args.rows:
+        records += run_benchmarks(rows, repeat=args.repeat, app=args.app, products=args.products,
+                                  postal_codes=args.postal_codes, customers=args.customers, seed=args.seed)
+
+    output = args.output or os.path.join('benchmarks', 'results', f'{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({'commit': commit,
+                   'created': datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'results': records}, file, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from modules import module as mod
+
+
+# Columns of the Superstore version format, as written by the `01_preliminary_etl` notebook
+VERSION_COLUMNS = ['Row ID', 'Order ID', 'Order Date', 'Ship Date', 'Ship Mode', 'Customer ID', 'Customer Name',
+                   'Segment', 'Country', 'City', 'State', 'Postal Code', 'Region', 'Product ID', 'Category',
+                   'Sub-Category', 'Product Name', 'Sales', 'Quantity', 'Discount', 'Profit', 'Shipping Days',
+                   'List Price', 'Net Price', 'COGS', 'Gross Margin', 'Product_encoded', 'Product PK',
+                   'Order Year', 'Order Month']
+
+REFERENCE_VERSION = 'Baseline.csv'
+
+
+def _empirical(rng, values, size):
+    """
+    Draws `size` values from the empirical distribution of `values`.
+    """
+    values = np.asarray(values)
+    return values[rng.integers(0, len(values), size)]
+
+
+def generate_superstore(rows, products=1800, postal_codes=630, customers=800, years=(2014, 2017), seed=0,
+                        reference=None):
+    """
+    Description: Generates a synthetic dataset in the Superstore version format, with the distributions of a
+    reference version: sub-category mix, list prices and cost ratios per sub-category, discounts per
+    sub-category, quantities, ship modes and shipping days, segments and the geography hierarchy.
+
+    Parameters:
+    - `rows` (int): The number of order lines.
+    - `products` (int): The number of distinct products (Product ID). Default is 1800.
+    - `postal_codes` (int): The number of distinct postal codes. Codes beyond those of the reference reuse the
+    City, State and Region of a reference code. Default is 630.
+    - `customers` (int): The number of distinct customers. Default is 800.
+    - `years` (tuple): The first and last 'Order Year'. Default is (2014, 2017).
+    - `seed` (int): The seed of the random generator. Default is 0.
+    - `reference` (pandas.DataFrame, optional): The version the distributions are taken from. Default is
+    `Baseline.csv` from the dataset store.
+
+    Return:
+    - `df` (pandas.DataFrame): The synthetic version, with the columns in `VERSION_COLUMNS`.
+    """
+    rng = np.random.default_rng(seed)
+    if reference is None:
+        reference = mod.load_version(REFERENCE_VERSION)
+
+    # Products: sub-category mix, log-normal list prices and cost ratios per sub-category
+    sub = reference.assign(**{'Log Price': np.log(reference['List Price']),
+                              'Cost Ratio': reference['COGS'] / reference['List Price']})
+    sub = sub.groupby(['Category', 'Sub-Category']).agg(share=('Row ID', 'size'),
+                                                         price_mu=('Log Price', 'mean'),
+                                                         price_sd=('Log Price', 'std'),
+                                                         cost_mu=('Cost Ratio', 'mean'),
+                                                         cost_sd=('Cost Ratio', 'std')).reset_index()
+    product_sub = rng.choice(len(sub), products, p=sub['share'] / sub['share'].sum())
+    list_price = mod.round_cents(np.exp(rng.normal(sub['price_mu'].to_numpy()[product_sub],
+                                                   sub['price_sd'].fillna(0).to_numpy()[product_sub])), 'half_up')
+    cost_ratio = np.clip(rng.normal(sub['cost_mu'].to_numpy()[product_sub],
+                                    sub['cost_sd'].fillna(0).to_numpy()[product_sub]), 0.3, 1.0)
+    product_cogs = mod.round_cents(list_price * cost_ratio, 'half_up')
+
+    categories = sub['Category'].to_numpy()[product_sub]
+    sub_categories = sub['Sub-Category'].to_numpy()[product_sub]
+    product_ids = np.array([f'{c[:3].upper()}-{s[:2].upper()}-{10000000 + i}'
+                            for i, (c, s) in enumerate(zip(categories, sub_categories))], dtype=object)
+    product_names = np.array([f'{s} {i:06d}' for i, s in enumerate(sub_categories)], dtype=object)
+    # Same codes as the `LabelEncoder` of the notebook: the rank of the name in sorted order
+    product_encoded = np.empty(products, dtype=object)
+    product_encoded[np.argsort(product_names)] = [str(i).zfill(5) for i in range(products)]
+    product_pk = np.array([f'{p}-{e}' for p, e in zip(product_ids, product_encoded)], dtype=object)
+
+    # Geography: reference postal codes by popularity, extended with new codes if more are requested
+    geo = reference.groupby('Postal Code').agg(count=('Row ID', 'size'), City=('City', 'first'),
+                                               State=('State', 'first'), Region=('Region', 'first'))
+    geo = geo.sort_values('count', ascending=False).reset_index()
+    geo_rows = np.arange(postal_codes) % len(geo)
+    geo_codes = geo['Postal Code'].to_numpy()[geo_rows]
+    extra = np.arange(postal_codes) >= len(geo)
+    geo_codes[extra] = geo['Postal Code'].max() + 1 + np.arange(extra.sum())
+    geo_weights = geo['count'].to_numpy()[geo_rows].astype('float64')
+
+    # Customers
+    segments = _empirical(rng, reference['Segment'], customers)
+    customer_ids = np.array([f'{chr(65 + i % 26)}{chr(65 + i // 26 % 26)}-{10000 + i}' for i in range(customers)],
+                            dtype=object)
+    customer_names = np.array([f'Customer {i:06d}' for i in range(customers)], dtype=object)
+
+    # Orders: about as many lines per order as the reference, with a date, ship mode, customer and address
+    lines_per_order = len(reference) / reference['Order ID'].nunique()
+    n_orders = max(1, int(rows / lines_per_order))
+    first = np.datetime64(f'{years[0]}-01-01')
+    days = (np.datetime64(f'{years[1] + 1}-01-01') - first).astype(int)
+    order_date = first + rng.integers(0, days, n_orders).astype('timedelta64[D]')
+    ship_sample = rng.integers(0, len(reference), n_orders)
+    ship_mode = reference['Ship Mode'].to_numpy()[ship_sample]
+    shipping_days = reference['Shipping Days'].to_numpy()[ship_sample]
+    order_customer = rng.integers(0, customers, n_orders)
+    order_geo = rng.choice(postal_codes, n_orders, p=geo_weights / geo_weights.sum())
+    order_year = order_date.astype('datetime64[Y]').astype(int) + 1970
+    order_ids = np.array([f'{"US" if c % 5 == 0 else "CA"}-{y}-{100000 + i}'
+                          for i, (y, c) in enumerate(zip(order_year, order_customer))], dtype=object)
+
+    # Order lines
+    line_order = np.sort(rng.integers(0, n_orders, rows))
+    popularity = rng.gamma(0.8, size=products)
+    line_product = rng.choice(products, rows, p=popularity / popularity.sum())
+    quantity = _empirical(rng, reference['Quantity'], rows)
+
+    discount = np.zeros(rows)
+    line_sub = product_sub[line_product]
+    for i, (category, sub_category) in enumerate(zip(sub['Category'], sub['Sub-Category'])):
+        in_sub = line_sub == i
+        observed = reference.loc[reference['Sub-Category'] == sub_category, 'Discount']
+        discount[in_sub] = _empirical(rng, observed, in_sub.sum())
+
+    line_list_price = list_price[line_product]
+    line_cogs = product_cogs[line_product]
+    net_price = mod.round_cents(line_list_price * (1 - discount), 'half_up')
+    sales = mod.round_cents(net_price * quantity, 'half_up')
+    profit = mod.round_cents((net_price - line_cogs) * quantity, 'half_up')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gross_margin = mod.round_cents((net_price - line_cogs) / net_price, 'half_up')
+
+    line_date = order_date[line_order]
+    line_geo = order_geo[line_order]
+    line_customer = order_customer[line_order]
+    geo_source = geo_rows[line_geo]
+
+    df = pd.DataFrame({
+        'Row ID': np.arange(1, rows + 1),
+        'Order ID': order_ids[line_order],
+        'Order Date': line_date.astype('datetime64[ns]'),
+        'Ship Date': (line_date + shipping_days[line_order].astype('timedelta64[D]')).astype('datetime64[ns]'),
+        'Ship Mode': ship_mode[line_order],
+        'Customer ID': customer_ids[line_customer],
+        'Customer Name': customer_names[line_customer],
+        'Segment': segments[line_customer],
+        'Country': 'United States',
+        'City': geo['City'].to_numpy()[geo_source],
+        'State': geo['State'].to_numpy()[geo_source],
+        'Postal Code': geo_codes[line_geo],
+        'Region': geo['Region'].to_numpy()[geo_source],
+        'Product ID': product_ids[line_product],
+        'Category': categories[line_product],
+        'Sub-Category': sub_categories[line_product],
+        'Product Name': product_names[line_product],
+        'Sales': sales,
+        'Quantity': quantity,
+        'Discount': discount,
+        'Profit': profit,
+        'Shipping Days': shipping_days[line_order],
+        'List Price': line_list_price,
+        'Net Price': net_price,
+        'COGS': line_cogs,
+        'Gross Margin': gross_margin,
+        'Product_encoded': product_encoded[line_product],
+        'Product PK': product_pk[line_product],
+        'Order Year': order_year[line_order],
+        'Order Month': line_date.astype('datetime64[M]').astype(int) % 12 + 1,
+    })
+    return df[VERSION_COLUMNS]
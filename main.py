@@ -9,14 +9,17 @@ import os
 import csv
 from modules import module as mod
 
-col_list = ['List Price', 'Net Price', 'Sales', 'COGS', 'Profit', 'Gross Margin']
-
 
 # Streamlit cheat-sheet https://docs.streamlit.io/develop/quick-reference/cheat-sheet
 
 
 # Pipeline
 
+##### Profiling (open the app with ?debug=1 or set SUPERSTORE_DEBUG=1 to show the performance panel and log each rerun)
+
+debug = st.query_params.get('debug') == '1' or os.environ.get('SUPERSTORE_DEBUG') == '1'
+mod.start_profile(debug)
+
 ##### Company logo
 
 st.sidebar.image('https://github.com/Kristinawk/final_project_ETL_Analytics/blob/main/notebooks/support_doc/logo_new.PNG?raw=true')
@@ -55,19 +58,25 @@ st.sidebar.header("Baseline for Simulation")
 # Initialize baseline list
 # baseline_list = ['Baseline.csv']
 
-simulations_file_path = './data/simulations_list.csv'
-baseline_list = mod.read_list_from_csv(simulations_file_path)
+baseline_list = mod.list_simulations() # registered versions (imported from './data/simulations_list.csv' on first use)
 
 baseline_data = tuple(baseline_list) # define selector options
 selector01 = st.sidebar.selectbox("Version", baseline_data, key='Version') # display selector
-path = './data/' + selector01 # apply selection
-df = pd.read_csv(path)
+dim_index = mod.version_dimension_index(selector01) # apply selection (memory-mapped version shared by all sessions, selectors read its index)
 
 ##### Select Year
 
-years = mod.fill_selector(df, 'Order Year') # define selector options
+years = mod.dimension_options(dim_index, 'Order Year') # define selector options
 selector02 = st.sidebar.selectbox("Year", years, key='Year') # display selector
-selected_data = mod.apply_filter(df, 'Order Year', selector02) # apply selection
+
+##### Select Period
+
+time_index = mod.version_time_index(selector01) # versions are stored by Order Date, periods are row slices
+selector03 = st.sidebar.selectbox("Period", mod.PERIODS, key='Period') # display selector
+rows = mod.period_rows(time_index, selector03, selector02) if selector03 != 'All' else None # apply selection
+year_filter = ('Order Year', selector02 if rows is None else 'All') # a period is already a slice of the year (a rolling window may start in the year before)
+filters = [year_filter]
+positions = mod.dimension_positions(dim_index, filters, rows)
 
 
 ##### Sidebar title 2
@@ -83,11 +92,12 @@ with col1:
     selector04 =  st.selectbox("Product level", product_level, key='Product Level') # display level selector
 
 with col2:
-    name = mod.select_name(selected_data, selector04)
+    name = mod.select_dimension_name(dim_index, selector04, positions)
     selector05 = st.selectbox("Product name", name, key='Product name') # display name selector
 
 if selector04 != "All":
-    selected_data = mod.apply_filter(selected_data, selector04, selector05) # apply selection
+    filters.append((selector04, selector05)) # apply selection
+    positions = mod.dimension_positions(dim_index, filters, rows)
 else:
     pass
 
@@ -100,21 +110,26 @@ with col1:
     selector06 =  st.selectbox("Geography level", geography_level, key='Geography level') # display level selector
 
 with col2:
-    name = mod.select_name(selected_data, selector06)
+    name = mod.select_dimension_name(dim_index, selector06, positions)
     selector07 = st.selectbox("Geography name", name, key='Geography name') # display name selector
 
 if selector06 != "All":
-    selected_data = mod.apply_filter(selected_data, selector06, selector07) # apply selection
+    filters.append((selector06, selector07)) # apply selection
+    positions = mod.dimension_positions(dim_index, filters, rows)
 else:
     pass
 
+
 ##### Output table
 
 st.title("Simulation Overview")
 
-baseline_view = mod.summary_tab(selected_data, 'Baseline', selector02)
+baseline_totals = mod.selection_totals(selector01, filters, 'Baseline', rows) # rolled up from the pre-aggregated cube (summed over the period's rows if one is selected)
+baseline_view = mod.summary_metrics(baseline_totals)
 
-simulation = selected_data.copy()
+simulation_params = {'Year': selector02, 'Period': selector03,
+                     'Product level': selector04, 'Product name': selector05,
+                     'Geography level': selector06, 'Geography name': selector07} # simulation spec, kept with saved simulations
 
 
 ##### Sidebar title 3
@@ -134,9 +149,7 @@ with col1:
 if selector08 == 'Increase in %':
     selector18 = col2.number_input("Enter a value between -100 and 100:", min_value=-100.00, max_value=100.00, step=1.00) # display data entry
 
-    simulation['List Price'] = simulation['List Price'] * (1 + selector18 / 100) # run simulation
-    simulation = mod.profit_calc(simulation, col_list)
-    #simulation
+    simulation_params['List Price'] = [selector08, selector18] # add lever to simulation spec
 
 elif selector08 == 'Target Value':
     selector18 = col2.number_input("Enter target value", min_value=0.00) # display data entry
@@ -144,9 +157,7 @@ elif selector08 == 'Target Value':
     if selector04 != 'Product ID':
         st.error('Error: Please select Product ID in _Product level_')
     else:
-        simulation['List Price'] = selector18 # run simulation
-        simulation = mod.profit_calc(simulation, col_list)
-        #simulation
+        simulation_params['List Price'] = [selector08, selector18] # add lever to simulation spec
 else: 
     pass
 
@@ -163,16 +174,12 @@ with col1:
 if selector09 == 'Target %':
     selector19 = col2.number_input("Enter a value between 0 and 100: ", min_value=0.00, max_value=100.00, step=1.00) # display data entry (space after text mandatory!)
 
-    simulation['Discount'] = selector19 / 100 # run simulation
-    simulation = mod.profit_calc(simulation, col_list)
-    #simulation
+    simulation_params['Discount'] = [selector09, selector19] # add lever to simulation spec
 
 elif selector09 == 'Max Treshold %':
     selector19 = col2.number_input("Enter a value between 0 and 100: ", min_value=0.00, max_value=100.00, step=1.00) # display data entry (space after text mandatory!)
 
-    simulation['Discount'] = simulation['Discount'].apply(lambda row: row if row < (selector19 / 100) else (selector19 / 100)) # run simulation
-    simulation = mod.profit_calc(simulation, col_list)
-    #simulation
+    simulation_params['Discount'] = [selector09, selector19] # add lever to simulation spec
 
 else: 
     pass
@@ -191,9 +198,7 @@ with col1:
 if selector10 == 'Increase in % ': 
     selector21 = col2.number_input("Enter a value between -100 and 100:  ", min_value=-100.00, max_value=100.00, step=1.00) # display data entry (space after text mandatory!)
 
-    simulation['COGS'] = simulation['COGS'] * (1 + selector21 / 100) # run simulation
-    simulation = mod.profit_calc(simulation, col_list)
-    #simulation
+    simulation_params['COGS'] = [selector10, selector21] # add lever to simulation spec
 
 elif selector10 == 'Target Value ':
     selector21 = col2.number_input("Enter target value  ", min_value=0.00) # display data entry (space after text mandatory!)
@@ -201,9 +206,7 @@ elif selector10 == 'Target Value ':
     if selector04 != 'Product ID':
         st.error('Error: Please select Product ID in _Product level_')
     else:
-        simulation['COGS'] = selector21 # run simulation
-        simulation = mod.profit_calc(simulation, col_list)
-        #simulation
+        simulation_params['COGS'] = [selector10, selector21] # add lever to simulation spec
 else:   
     pass
 
@@ -221,40 +224,82 @@ with col1:
 if selector11 == 'Target % ':
     selector31 = col2.number_input("Enter a value between 0 and 100:   ", min_value=0.00, max_value=100.00, step=1.00) # display data entry (space after text mandatory!)
 
-    simulation['Gross Margin'] = selector31 / 100 # run simulation
-    simulation = mod.gross_margin_calc(simulation, col_list)
-    #simulation
+    simulation_params['Gross Margin'] = [selector11, selector31] # add lever to simulation spec
 
 elif selector11 == 'Min Treshold % ':
     selector31= col2.number_input("Enter a value between 0 and 100:   ", min_value=0.00, max_value=100.00, step=1.00) # display data entry (space after text mandatory!)
 
-    simulation['Gross Margin'] = simulation['Gross Margin'].apply(lambda row: row if row >= (selector31 / 100) else (selector31 / 100)) # run simulation
-    simulation = mod.gross_margin_calc(simulation, col_list)
-    #simulation
+    simulation_params['Gross Margin'] = [selector11, selector31] # add lever to simulation spec
 
 else:
     pass
 
 
+##### Goal seek
+
+st.sidebar.header("Solve for")
+
+col1, col2 = st.sidebar.columns(2)
+with col1:
+    selector51 = st.pills("Select lever", tuple(mod.GOAL_LEVERS), key='Solve for lever') # display lever selector
+with col2:
+    selector52 = st.pills("Select target", tuple(mod.GOAL_METRICS), key='Solve for metric') # display target selector
+
+if selector51 and selector52 == 'Profit':
+    selector53 = st.sidebar.number_input("Enter target Profit", value=float(baseline_view['Profit'].iloc[0]) if len(baseline_view) else 0.00, step=100.00) # display data entry
+elif selector51 and selector52 == 'GM %':
+    selector53 = st.sidebar.number_input("Enter target GM % between -100 and 100", min_value=-100.00, max_value=99.99, value=20.00, step=1.00) / 100 # display data entry
+else:
+    pass
+
+
+##### Run simulation
+
+simulation = mod.simulation_overlay(selector01, positions, simulation_params) # all levers in one pass, simulated columns of the selection only
+
+
 ##### Simulation output  - Selection
 
 st.header('Selection')
 
-simulation_view = mod.summary_tab(simulation, 'Simulation', selector02)
+simulation_change = mod.overlay_change(simulation) # change of the measures, added to the Total Business below
+simulation_totals = mod.overlay_totals(simulation, 'Simulation') # summed from the simulated rows of the selection
+simulation_view = mod.summary_metrics(simulation_totals)
 output_table_selection = pd.concat([baseline_view, simulation_view])
 output_table_selection
 
 mod.comparison_bar_charts(output_table_selection, df_name='selection')
 
+trend_selection = mod.monthly_trend(selector01, simulation, positions=positions) # monthly Sales and Profit of the selected rows
+mod.trend_charts(trend_selection, df_name='selection')
+
+
+##### Goal seek output - Selection
+
+if selector51 and selector52:
+    st.header('Solve for')
+
+    try:
+        goal_columns = mod.SIMULATION_INPUT_COLUMNS + ['Sales', 'Profit']
+        output_table_goal = mod.goal_seek(mod.load_version(selector01, goal_columns).take(positions), selector51, selector52, selector53) # closed form + vectorized bisection
+        st.info(f"{selector51}: {output_table_goal[selector51].iloc[0]:.2f} reaches {selector52} {output_table_goal[selector52].iloc[0]} on the selection")
+        output_table_goal
+    except ValueError as error:
+        st.error(f'Error: {error}')
+else:
+    pass
+
 
 ##### Simulation output  - Total Business including Selection
 
 st.header('Total Business including Selection')
 
-baseline_total_view = mod.summary_tab(df, 'Baseline', selector02)
+baseline_grand_totals = mod.selection_totals(selector01, [year_filter], 'Baseline', rows)
+baseline_total_view = mod.summary_metrics(baseline_grand_totals)
 
-simulation_total = mod.insert_changes(df, simulation)
-simulation_total_view = mod.summary_tab(simulation_total, 'Simulation', selector02)
+# Total simulation = total baseline + change of the selection (no merged copy of df needed)
+simulation_grand_totals = mod.apply_totals_change(baseline_grand_totals, simulation_change, 'Simulation')
+simulation_total_view = mod.summary_metrics(simulation_grand_totals)
 
 output_table_total = pd.concat([baseline_total_view, simulation_total_view])
 output_table_total
@@ -262,23 +307,80 @@ output_table_total
 
 mod.comparison_bar_charts(output_table_total, df_name='total')
 
+trend_rows = mod.period_rows(time_index, selector03, selector02) # the selected year even if Period is 'All'
+trend_total = mod.monthly_trend(selector01, simulation, rows=trend_rows) # from the precomputed monthly totals
+mod.trend_charts(trend_total, df_name='total')
+
+
+##### Simulation output  - Drill-down of the Selection
+
+st.header('Drill-down')
+
+drilldown_levels = ('Category', 'Sub-Category', 'Product ID', 'Segment', 'Region', 'State', 'City', 'Postal Code', 'Order Month') # define selector options
+
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    selector41 = st.multiselect("Break down by", drilldown_levels, key='Drill-down levels') # display selector
+with col2:
+    selector42 = st.selectbox("Rank by", ('Profit', 'GM %'), key='Drill-down rank') # display selector
+with col3:
+    selector43 = st.selectbox("Show", ('Top', 'Bottom'), key='Drill-down side') # display selector
+with col4:
+    selector44 = st.number_input("Groups", min_value=1, value=10, step=1, key='Drill-down groups') # display data entry
+
+if selector41:
+    output_table_drilldown = mod.overlay_summary(simulation, selector41) # baseline and simulation in one aggregation
+    output_table_drilldown = mod.top_groups(output_table_drilldown, selector44, selector42, bottom=selector43 == 'Bottom') # ranked on the baseline
+    output_table_drilldown
+else:
+    pass
+
+
+##### Version comparison - Selection against other saved versions
+
+st.header('Version Comparison')
+
+col1, col2 = st.columns(2)
+with col1:
+    comparison_versions = st.multiselect("Compare with", [v for v in baseline_list if v != selector01], key='Compare versions') # display selector
+with col2:
+    comparison_level = st.selectbox("Breakdown level", ('All',) + product_level[1:] + geography_level[1:], key='Comparison level') # display level selector
+
+if comparison_versions:
+    output_table_comparison = mod.compare_versions(selector01, comparison_versions,
+                                                   None if comparison_level == 'All' else comparison_level, positions) # changed rows only, no merges
+    output_table_comparison
+else:
+    pass
+
 
 ##### Save button
 
+# Enter the Simulation Name, then save it in the background (the app stays usable while the file is written)
+simulation_name = st.text_input("Enter Simulation Name:", key='Simulation name')
+
 # Create a Save button with an icon
 if st.button("💾 Save Simulation"):
     
-    # If the button is clicked, show the text input for Simulation Name
-    simulation_name = st.text_input("Enter Simulation Name:")
-    
-    # When the user enters a name, allow them to save it
+    # When the user entered a name, hand the save off to a background writer
     if simulation_name:
-        saved_simulation = mod.save_simulation(simulation_total, simulation_name)
-        baseline_list.append(saved_simulation)
-        mod.save_list_to_csv(baseline_list, simulations_file_path)
+        save_job = mod.save_simulation_async(mod.read_overlay(simulation, ['Row ID'] + list(simulation['columns'])),
+                                             simulation_name, selector01, simulation_params) # registered once written
+        st.session_state.setdefault('save_jobs', []).append(save_job)
     else:
         st.warning("Please enter a simulation name before saving.")
 
+save_jobs = st.session_state.get('save_jobs', [])
+
+# Refresh the progress every second while a save runs, rerun the app when one finishes (new Version option)
+@st.fragment(run_every=1 if any(mod.save_status(job)[0] == 'running' for job in save_jobs) else None)
+def save_progress():
+    if mod.show_save_jobs(save_jobs):
+        st.rerun()
+
+save_progress()
 
 
+##### Performance panel
 
+mod.profile_panel(mod.finish_profile()) # only shown in debug mode
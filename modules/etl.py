@@ -0,0 +1,248 @@
+"""
+ETL of the raw Superstore export into the version format used by the app (same output as the
+`01_preliminary_etl` notebook), vectorized and streamed in chunks.
+
+Usage (from the repository root):
+
+    python -m modules.etl
+    python -m modules.etl --source "./data/Sample - Superstore.csv" --output ./data/Superstore_250307.csv
+    python -m modules.etl --source ./data/orders_250308.csv --append Superstore_250307.csv
+"""
+import argparse
+import csv
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from modules import module as mod
+
+
+SOURCE_PATH = './data/Sample - Superstore.csv'
+SOURCE_ENCODING = 'ISO-8859-1'
+ENCODING_MAP_PATH = './data/product_encoding.csv'
+CHUNKSIZE = 100000
+
+# Cities replaced in the source (one postal code per city, see `00_poc_normalized_data_model`)
+CITY_REPLACEMENTS = {'Encinitas': 'San Diego'}
+
+
+def read_encoding_map(file_path):
+    """
+    Description: Reads the Product Name -> Product_encoded map of previous ETL runs.
+
+    Parameters:
+    - `file_path` (str): The path of the map (CSV with 'Product Name' and 'Product_encoded').
+
+    Return:
+    - `encoding` (dict): The code of each product name, empty if the file does not exist.
+    """
+    if not os.path.exists(file_path):
+        return {}
+    encoding = pd.read_csv(file_path, dtype={'Product_encoded': 'str'}, keep_default_na=False)
+    return dict(zip(encoding['Product Name'], encoding['Product_encoded']))
+
+
+def save_encoding_map(encoding, file_path):
+    """
+    Description: Saves the Product Name -> Product_encoded map, sorted by code.
+
+    Parameters:
+    - `encoding` (dict): The code of each product name.
+    - `file_path` (str): The path of the map.
+    """
+    with open(file_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Product Name', 'Product_encoded'])
+        for name, code in sorted(encoding.items(), key=lambda item: item[1]):
+            writer.writerow([name, code])
+
+
+def extend_encoding(encoding, names):
+    """
+    Description: Adds codes for new product names without renumbering existing ones. New names get the next
+    codes in sorted order, so on an empty map the codes are the same as the `LabelEncoder` of the notebook
+    (the rank of the name in sorted order, zero-padded to 5 digits).
+
+    Parameters:
+    - `encoding` (dict): The existing code of each product name. It is extended in place.
+    - `names` (iterable): Product names, new or existing.
+
+    Return:
+    - `encoding` (dict): The extended map.
+    """
+    new_names = sorted(set(names) - set(encoding))
+    start = max((int(code) for code in encoding.values()), default=-1) + 1
+    for i, name in enumerate(new_names):
+        encoding[name] = str(start + i).zfill(5)
+    return encoding
+
+
+def transform(df, encoding):
+    """
+    Description: Computes the derived columns of the version format on a chunk of raw Superstore rows, with
+    vectorized operations: Shipping Days, List Price, Net Price, COGS, Gross Margin (rounded half up to cents,
+    like `Decimal.quantize(ROUND_HALF_UP)` in the notebook), Product_encoded, Product PK, Order Year and
+    Order Month.
+
+    Parameters:
+    - `df` (pandas.DataFrame): Raw rows, as read from the Superstore export.
+    - `encoding` (dict): The code of each product name (see `extend_encoding`).
+
+    Return:
+    - `df` (pandas.DataFrame): The rows with the derived columns.
+    """
+    df = df.copy()
+    df['Order Date'] = pd.to_datetime(df['Order Date'])
+    df['Ship Date'] = pd.to_datetime(df['Ship Date'])
+    df['Shipping Days'] = (df['Ship Date'] - df['Order Date']).dt.days
+
+    sales = df['Sales'].to_numpy(dtype='float64')
+    quantity = df['Quantity'].to_numpy(dtype='float64')
+    discount = df['Discount'].to_numpy(dtype='float64')
+    profit = df['Profit'].to_numpy(dtype='float64')
+
+    list_price = np.where(discount != 0, sales / (1 - discount) / quantity, sales / quantity)
+    df['List Price'] = mod.round_cents(list_price, 'half_up')
+    df['Net Price'] = mod.round_cents(sales / quantity, 'half_up')
+    df['COGS'] = mod.round_cents((sales - profit) / quantity, 'half_up')
+
+    net_price = df['Net Price'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['Gross Margin'] = mod.round_cents((net_price - df['COGS'].to_numpy()) / net_price, 'half_up')
+
+    df['Product_encoded'] = df['Product Name'].map(encoding)
+    df['Product PK'] = df['Product ID'] + '-' + df['Product_encoded']
+
+    df['City'] = df['City'].replace(CITY_REPLACEMENTS)
+
+    df['Order Year'] = df['Order Date'].dt.year
+    df['Order Month'] = df['Order Date'].dt.month
+    return df
+
+
+def run_etl(source=SOURCE_PATH, output=None, encoding_map=ENCODING_MAP_PATH, chunksize=CHUNKSIZE):
+    """
+    Description: Builds a version file from the raw Superstore export. The source is read in chunks: a first pass
+    over the 'Product Name' column extends the product encoding, a second pass transforms each chunk and appends
+    it to the output. Memory is bounded by the chunk size. The output is written to a temporary file and renamed
+    at the end, so an interrupted run never leaves a partial version.
+
+    Parameters:
+    - `source` (str): The path of the raw export (ISO-8859-1). Default is `SOURCE_PATH`.
+    - `output` (str, optional): The path of the version file. Default is './data/Superstore_<yymmdd>.csv'.
+    - `encoding_map` (str): The path of the Product Name -> Product_encoded map, reused and extended so codes are
+    stable across runs. Default is `ENCODING_MAP_PATH`.
+    - `chunksize` (int): The number of rows per chunk. Default is `CHUNKSIZE`.
+
+    Return:
+    - `output` (str): The path of the version file.
+    """
+    if output is None:
+        output = os.path.join(mod.DATA_DIR, 'Superstore_' + datetime.now().strftime('%y%m%d') + '.csv')
+
+    # Pass 1: product encoding (names of all chunks first, so new codes follow the sorted order of the names)
+    names = set()
+    for chunk in pd.read_csv(source, encoding=SOURCE_ENCODING, usecols=['Product Name'], chunksize=chunksize):
+        names.update(chunk['Product Name'].unique())
+    encoding = extend_encoding(read_encoding_map(encoding_map), names)
+    save_encoding_map(encoding, encoding_map)
+
+    # Pass 2: transform and append
+    temp_path = output + '.tmp'
+    header = True
+    for chunk in pd.read_csv(source, encoding=SOURCE_ENCODING, chunksize=chunksize):
+        transform(chunk, encoding).to_csv(temp_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    os.replace(temp_path, output)
+
+    return output
+
+
+def version_encoding(version, encoding):
+    """
+    Description: Checks the product encoding of a version against the Product Name -> Product_encoded map and
+    adds the codes of the version that the map does not have. A product name with two codes, a code used by two
+    names or a Product PK that is not 'Product ID-Product_encoded' means the version and the map were not built
+    by the same encoding, so new codes would not be consistent.
+
+    Parameters:
+    - `version` (str): The name of the version as listed in the Version selector.
+    - `encoding` (dict): The code of each product name (see `read_encoding_map`). It is extended in place.
+
+    Return:
+    - `encoding` (dict): The checked and extended map.
+    """
+    products = mod.load_version(version, ['Product ID', 'Product Name', 'Product_encoded', 'Product PK'])
+    products = products.astype(object).drop_duplicates()
+
+    wrong_pk = products[products['Product PK'] != products['Product ID'] + '-' + products['Product_encoded']]
+    if len(wrong_pk):
+        raise ValueError(f"Product PK does not match 'Product ID-Product_encoded' in {version}: "
+                         f"{wrong_pk['Product PK'].head().tolist()}")
+
+    codes = products[['Product Name', 'Product_encoded']].drop_duplicates()
+    names = codes['Product Name'][codes['Product Name'].duplicated()]
+    if len(names):
+        raise ValueError(f'Product names with several codes in {version}: {names.head().tolist()}')
+    conflicts = [name for name, code in zip(codes['Product Name'], codes['Product_encoded'])
+                 if encoding.get(name, code) != code]
+    if conflicts:
+        raise ValueError(f'Product codes of {version} differ from the encoding map: {conflicts[:5]}')
+
+    encoding.update(zip(codes['Product Name'], codes['Product_encoded']))
+    names = pd.Series(list(encoding.keys()))[pd.Series(list(encoding.values())).duplicated(keep=False)]
+    if len(names):
+        raise ValueError(f'Product codes used by several names: {names.head().tolist()}')
+    return encoding
+
+
+def append_batch(source, version, encoding_map=ENCODING_MAP_PATH):
+    """
+    Description: Appends a batch of new raw Superstore rows (e.g. a daily order feed) to a version, without
+    rerunning the ETL over the whole history. The product encoding is checked against the version (see
+    `version_encoding`) and new product names get the next codes, existing codes are never renumbered. The
+    transformed rows are appended with `module.append_version`, which checks the Row IDs and refreshes only the
+    derived data of the affected years and months. The map is saved once the rows are appended.
+
+    Parameters:
+    - `source` (str): The path of the batch (raw export format, ISO-8859-1).
+    - `version` (str): The name of the version as listed in the Version selector (e.g. 'Superstore_250307.csv').
+    - `encoding_map` (str): The path of the Product Name -> Product_encoded map. Default is `ENCODING_MAP_PATH`.
+
+    Return:
+    - `months` (list): The affected months, as 'YYYY-MM'.
+    """
+    batch = pd.read_csv(source, encoding=SOURCE_ENCODING)
+
+    encoding = version_encoding(version, read_encoding_map(encoding_map))
+    encoding = extend_encoding(encoding, batch['Product Name'].unique())
+
+    months = mod.append_version(version, transform(batch, encoding))
+    save_encoding_map(encoding, encoding_map)
+    return months
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a Superstore version file from the raw export.')
+    parser.add_argument('--source', default=SOURCE_PATH, help=f'raw export (default: {SOURCE_PATH})')
+    parser.add_argument('--output', help="version file (default: ./data/Superstore_<yymmdd>.csv)")
+    parser.add_argument('--encoding-map', default=ENCODING_MAP_PATH,
+                        help=f'product encoding map (default: {ENCODING_MAP_PATH})')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help=f'rows per chunk (default: {CHUNKSIZE})')
+    parser.add_argument('--append', metavar='VERSION',
+                        help='append the source rows to this version (e.g. Superstore_250307.csv) instead')
+    args = parser.parse_args()
+
+    if args.append:
+        months = append_batch(args.source, args.append, args.encoding_map)
+        print(f"Rows appended to {args.append}, months refreshed: {', '.join(months)}")
+        return
+
+    output = run_etl(args.source, args.output, args.encoding_map, args.chunksize)
+    print(f'Version written to {output}')
+
+
+if __name__ == '__main__':
+    main()
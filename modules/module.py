@@ -1,225 +1,2539 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
 import plotly.express as px
-import math
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 import os
 import csv
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+# Profiling
+
+PROFILE_LOG = './logs/profile.jsonl'
+
+_profile = threading.local()  # one profile per Streamlit session thread
+
+
+def _memory_mb():
+    """
+    Returns the resident memory of the process in MB (0 where /proc is not available).
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+
+def _row_count(obj):
+    """
+    Returns the number of rows of a stage input or output, or None if it has no rows.
+    """
+    if isinstance(obj, (pd.DataFrame, np.ndarray)):
+        return len(obj)
+    if isinstance(obj, dict) and 'positions' in obj:
+        return len(obj['positions'])
+    return None
+
+
+def start_profile(enabled=True):
+    """
+    Description: Starts the profile of a rerun in the current thread. Stages (see `profile_stage` and
+    `profiled`) are only recorded while a profile is active; otherwise the hooks return at once.
+
+    Parameters:
+    - `enabled` (bool): Record this rerun. Default is True.
+    """
+    _profile.stages = [] if enabled else None
+    _profile.depth = 0
+    _profile.start = time.perf_counter()
+
+
+@contextmanager
+def profile_stage(name, rows_in=None):
+    """
+    Description: Records the wall time, the rows in and out and the memory delta of a pipeline stage, if a
+    profile is active in the current thread. Set `stage['rows_out']` on the yielded dictionary to record the
+    output rows.
+
+    Parameters:
+    - `name` (str): The name of the stage.
+    - `rows_in` (int, optional): The number of input rows.
+    """
+    stages = getattr(_profile, 'stages', None)
+    if stages is None:
+        yield {}
+        return
+
+    stage = {'stage': name, 'depth': _profile.depth, 'rows_in': rows_in, 'rows_out': None}
+    stages.append(stage)
+    _profile.depth += 1
+    memory = _memory_mb()
+    start = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        stage['seconds'] = time.perf_counter() - start
+        stage['memory_delta_mb'] = _memory_mb() - memory
+        _profile.depth -= 1
+
+
+def profiled(name=None):
+    """
+    Description: Decorator recording each call of a function as a stage (see `profile_stage`). The rows in and
+    out are taken from the first argument and from the result when they are DataFrames, arrays or overlays.
+
+    Parameters:
+    - `name` (str, optional): The name of the stage. Default is the function name.
+    """
+    def decorator(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_profile, 'stages', None) is None:
+                return fn(*args, **kwargs)
+            with profile_stage(stage_name, _row_count(args[0]) if args else None) as stage:
+                result = fn(*args, **kwargs)
+                stage['rows_out'] = _row_count(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def finish_profile(log_path=PROFILE_LOG):
+    """
+    Description: Ends the profile of the current rerun and appends it to a JSONL log (one record per rerun).
+
+    Parameters:
+    - `log_path` (str, optional): The path of the log. No log is written if None. Default is `PROFILE_LOG`.
+
+    Return:
+    - `record` (dict): `'created'`, `'seconds'` (whole rerun) and `'stages'`, or None if no profile is active.
+    """
+    stages = getattr(_profile, 'stages', None)
+    if stages is None:
+        return None
+    _profile.stages = None
+
+    record = {'created': datetime.now().isoformat(timespec='seconds'),
+              'seconds': time.perf_counter() - _profile.start,
+              'stages': stages}
+    if log_path:
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        with open(log_path, mode='a') as file:
+            file.write(json.dumps(record) + '\n')
+    return record
+
+
+def profile_panel(record):
+    """
+    Description: Displays the profile of a rerun in a collapsible panel of the app.
+
+    Parameters:
+    - `record` (dict): The profile, from `finish_profile`.
+    """
+    if record is None:
+        return
+    with st.expander(f"⏱️ Performance ({record['seconds'] * 1000:.0f} ms)"):
+        stages = pd.DataFrame(record['stages'], columns=['stage', 'depth', 'seconds', 'rows_in', 'rows_out',
+                                                         'memory_delta_mb'])
+        stages['stage'] = ['    ' * depth + stage for stage, depth in zip(stages['stage'], stages['depth'])]
+        stages['ms'] = stages['seconds'] * 1000
+        st.dataframe(stages[['stage', 'ms', 'rows_in', 'rows_out', 'memory_delta_mb']], hide_index=True)
+
+
+# Dataset store
+
+DATA_DIR = './data'
+STORE_DIR = './data/.store'
+
+# Column types for the Superstore version format. Dimension columns are categoricals (integer codes, with
+# dictionaries shared by all loaded versions) and small counters use narrow integers. Columns that are not
+# listed here keep the type inferred by `read_csv`, so older files with fewer or extra columns still load.
+VERSION_DTYPES = {
+    'Row ID': 'int32',
+    'Order ID': 'category',
+    'Ship Mode': 'category',
+    'Customer ID': 'category',
+    'Customer Name': 'category',
+    'Segment': 'category',
+    'Country': 'category',
+    'City': 'category',
+    'State': 'category',
+    'Postal Code': 'int32',
+    'Region': 'category',
+    'Product ID': 'category',
+    'Category': 'category',
+    'Sub-Category': 'category',
+    'Product Name': 'category',
+    'Quantity': 'int16',
+    'Shipping Days': 'int8',
+    'Product_encoded': 'category',  # zero-padded codes, e.g. '00386'
+    'Product PK': 'category',
+    'Order Year': 'int16',
+    'Order Month': 'int8',
+}
+VERSION_DATE_COLUMNS = ['Order Date', 'Ship Date']
+STORE_SCHEMA_VERSION = 4  # part of the store file names, so copies written with an older schema are rebuilt
+
+# Star schema of the store, with the keys of the `00_poc_normalized_data_model` notebook. Each dimension table
+# (key column, attribute columns) is stored once for all versions and only grows: a row number is never reused,
+# so it is the integer key of the dimension. A version only keeps its order_items fact table: 'Row ID', the
+# measures and one integer key per dimension.
+STAR_DIMENSIONS = {
+    'orders': ('Order ID', ['Order Date', 'Ship Date', 'Ship Mode', 'Shipping Days', 'Order Year', 'Order Month']),
+    'customers': ('Customer ID', ['Customer Name', 'Segment']),
+    'geography': ('Postal Code', ['Country', 'City', 'State', 'Region']),
+    'products': ('Product PK', ['Product ID', 'Category', 'Sub-Category', 'Product Name', 'Product_encoded']),
+}
+STAR_KEYS = {'orders': 'order_key', 'customers': 'customer_key', 'geography': 'geography_key',
+             'products': 'product_key'}
+STORE_METADATA_KEY = b'star'
+STORE_LOCK_TIMEOUT = 60  # seconds, after which the lock file of a crashed process is removed
+
+# Saved simulations only store the rows and columns that differ from their parent version
+DELTA_SUFFIX = '.delta.parquet'
+SNAPSHOT_METADATA_KEY = b'simulation'
+
+_version_cache = {}
+_version_lock = threading.RLock()  # guards the cache entries, shared by all sessions and the save threads
+_shared_categories = {}
+_dimension_cache = {}
+_store_lock = threading.Lock()
+
+
+def store_path(file_name):
+    """
+    Description: Returns the path of the order_items fact table of a registered version (Arrow IPC file,
+    uncompressed and memory-mapped, so all sessions and processes share its pages).
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector (e.g. 'Baseline.csv').
+
+    Return:
+    - `path` (str): The path of the Arrow file inside `STORE_DIR`.
+    """
+    return os.path.join(STORE_DIR, os.path.splitext(file_name)[0] + f'.v{STORE_SCHEMA_VERSION}.arrow')
+
+
+def dimension_path(name):
+    """
+    Description: Returns the path of a dimension table of the store (see `STAR_DIMENSIONS`).
+
+    Parameters:
+    - `name` (str): The name of the dimension, e.g. 'products'.
+
+    Return:
+    - `path` (str): The path of the Arrow file inside `STORE_DIR`.
+    """
+    return os.path.join(STORE_DIR, 'dimensions', f'{name}.v{STORE_SCHEMA_VERSION}.arrow')
+
+
+def apply_version_schema(df):
+    """
+    Description: Converts the columns of a version to the types of `VERSION_DTYPES`. Integer columns are only
+    narrowed when all their values fit, so the data stays exact; dimension columns become sorted categoricals.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The data of a version.
+
+    Return:
+    - `df` (pandas.DataFrame): The data with the declared types.
+    """
+    df = df.copy(deep=False)
+    for col, dtype in VERSION_DTYPES.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype == 'category':
+            df[col] = df[col].astype('category')  # categories are sorted
+        elif pd.api.types.is_integer_dtype(df[col]):
+            limits = np.iinfo(dtype)
+            if df[col].empty or (limits.min <= df[col].min() and df[col].max() <= limits.max):
+                df[col] = df[col].astype(dtype)
+    return df
+
+
+def _share_categories(df):
+    """
+    Makes the categorical columns of a newly loaded version use the process-wide dictionaries of the other
+    versions, so the categories are held once. A dictionary is replaced by the sorted union when a version
+    brings new values; versions loaded before keep their own (still valid) dictionary.
+    """
+    for col in df.columns:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        shared = _shared_categories.get(col)
+        categories = df[col].cat.categories
+        if shared is None or not categories.isin(shared.categories).all():
+            values = categories if shared is None else shared.categories.union(categories)
+            shared = pd.CategoricalDtype(values.sort_values())
+            _shared_categories[col] = shared
+        df[col] = df[col].astype(shared)
+    return df
+
+
+def _temporary_path(path):
+    """
+    Returns a temporary name next to `path`, distinct for each process and thread writing it at the same time.
+    """
+    return f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+
+
+def _write_arrow(table, path):
+    """
+    Writes an Arrow IPC file under a temporary name and renames it, so other processes never map a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = _temporary_path(path)
+    with pa.OSFile(temp_path, 'wb') as file:
+        with pa.ipc.new_file(file, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temp_path, path)
+
+
+def _write_parquet(df, path):
+    """
+    Writes a Parquet file under a temporary name and renames it, so other sessions never read a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = _temporary_path(path)
+    df.to_parquet(temp_path, index=False)
+    os.replace(temp_path, path)
+
+
+def _refresh_lock(path, token, released):
+    """
+    Keeps a held lock file recent: its modification time is updated until `released` is set, so waiters do not
+    take it for the lock of a crashed process while a long update runs.
+    """
+    while not released.wait(STORE_LOCK_TIMEOUT / 4):
+        try:
+            with open(path) as file:
+                if file.read() != token:
+                    return  # taken over, the holder stalled for longer than `STORE_LOCK_TIMEOUT`
+            os.utime(path)
+        except OSError:
+            return
+
+
+@contextmanager
+def store_lock():
+    """
+    Description: Serializes the updates of the dimension tables between threads and processes, with a lock file
+    created exclusively in `STORE_DIR`. The holder refreshes the modification time of the file while it runs, so
+    a lock file older than `STORE_LOCK_TIMEOUT` is left by a crashed process and is removed. The file holds the
+    token of its holder, which only removes its own lock.
+    """
+    path = os.path.join(STORE_DIR, 'dimensions.lock')
+    token = f'{os.getpid()}-{threading.get_ident()}-{time.time_ns()}'
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with _store_lock:
+        while True:
+            try:
+                descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                with os.fdopen(descriptor, 'w') as file:
+                    file.write(token)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > STORE_LOCK_TIMEOUT:
+                        os.remove(path)
+                except OSError:
+                    pass  # released in the meantime
+                time.sleep(0.05)
+
+        released = threading.Event()
+        refresher = threading.Thread(target=_refresh_lock, args=(path, token, released), daemon=True)
+        refresher.start()
+        try:
+            yield
+        finally:
+            released.set()
+            refresher.join()
+            try:
+                with open(path) as file:
+                    owned = file.read() == token
+                if owned:
+                    os.remove(path)
+            except OSError:
+                pass  # removed as stale while the holder stalled
+
+
+def read_dimension(name, rows=0):
+    """
+    Description: Reads a dimension table of the store. The file is memory-mapped once per process and read again
+    only when another version added rows to it.
+
+    Parameters:
+    - `name` (str): The name of the dimension, e.g. 'products'.
+    - `rows` (int): The number of rows the caller relies on. Default is 0.
+
+    Return:
+    - `table` (pyarrow.Table): The dimension table, None if it does not exist yet.
+    """
+    path = dimension_path(name)
+    if not os.path.exists(path):
+        if rows:
+            raise FileNotFoundError(f"The dimension table '{path}' is missing, delete '{STORE_DIR}' to rebuild the "
+                                    "store")
+        return None
+
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    cached = _dimension_cache.get(name)
+    if cached is None or cached[0] != key:
+        cached = (key, pa.ipc.open_file(pa.memory_map(path)).read_all())
+        _dimension_cache[name] = cached
+
+    table = cached[1]
+    if table.num_rows < rows:
+        raise ValueError(f"The dimension table '{path}' has fewer rows than its versions, delete '{STORE_DIR}' to "
+                         "rebuild the store")
+    return table
+
+
+def _key_positions(keys, values):
+    """
+    Returns the position of each value in `keys` (-1 if missing). Categorical values are looked up once per
+    category instead of once per row.
+    """
+    index = pd.Index(keys.to_numpy(dtype=object) if isinstance(keys.dtype, pd.CategoricalDtype) else keys)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return index.get_indexer(values.cat.categories.astype(object))[values.cat.codes]
+    return index.get_indexer(values)
+
+
+def _same_values(left, right):
+    """
+    Returns True if two columns hold the same values row by row (missing values are equal).
+    """
+    if isinstance(left.dtype, pd.CategoricalDtype) or isinstance(right.dtype, pd.CategoricalDtype):
+        left, right = left.astype(object), right.astype(object)
+    left, right = left.to_numpy(), right.to_numpy()
+    return bool(((left == right) | (pd.isna(left) & pd.isna(right))).all())
+
+
+def normalize_version(df):
+    """
+    Description: Splits a version into the star schema of the store (see `STAR_DIMENSIONS`). The dimension rows
+    that are not stored yet are appended to the dimension tables and each row of the version gets the integer key
+    of its dimension rows. Attributes that do not match the stored dimension row of their key (or that the stored
+    table does not have) stay in the fact table, so the version is rebuilt exactly. Dimensions whose key column is
+    missing or has empty values are not used.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The data of a version, with the types of `VERSION_DTYPES`.
+
+    Return:
+    - `fact` (pandas.DataFrame): The order_items fact table: the remaining columns and the keys of `STAR_KEYS`.
+    - `info` (dict): `'columns'` (the columns of the version, in order) and `'dimensions'` (the number of rows of
+    each dimension table used by the keys).
+    """
+    fact = df
+    dimensions = {}
+    with store_lock():
+        for name, (key, attributes) in STAR_DIMENSIONS.items():
+            if key not in df.columns or df[key].isna().any():
+                continue
+
+            stored = read_dimension(name)
+            stored = None if stored is None else stored.to_pandas()
+            columns = [key] + [col for col in attributes
+                               if col in df.columns and (stored is None or col in stored.columns)]
+
+            positions = np.full(len(df), -1) if stored is None else _key_positions(stored[key], df[key])
+            rows = df.loc[positions < 0, columns].drop_duplicates(key)
+            if stored is None or len(rows):
+                # New keys get the next row numbers
+                new_positions = _key_positions(rows[key], df[key]) + (0 if stored is None else len(stored))
+                positions = np.where(positions < 0, new_positions, positions)
+                stored = apply_version_schema(rows if stored is None else pd.concat([stored, rows], ignore_index=True))
+                _write_arrow(pa.Table.from_pandas(stored, preserve_index=False), dimension_path(name))
+
+            joined = [col for col in columns
+                      if col == key or _same_values(df[col], stored[col].take(positions).reset_index(drop=True))]
+            fact = fact.drop(columns=joined).assign(**{STAR_KEYS[name]: positions.astype('int32')})
+            dimensions[name] = len(stored)
+
+    return fact, {'columns': list(df.columns), 'dimensions': dimensions}
+
+
+def join_dimensions(fact, dimensions, columns):
+    """
+    Description: Rebuilds columns of a version from its fact table: columns of the fact table are used as they
+    are, dimension attributes are taken from the dimension tables by integer key (categoricals keep their codes).
+
+    Parameters:
+    - `fact` (pyarrow.Table): The order_items fact table of the version.
+    - `dimensions` (dict): The number of rows of each dimension table used by the keys (see `normalize_version`).
+    - `columns` (list): The columns to rebuild.
+
+    Return:
+    - `table` (pyarrow.Table): The columns, in the given order.
+    """
+    tables = {name: read_dimension(name, rows) for name, rows in dimensions.items()}
+    arrays = []
+    for col in columns:
+        if col in fact.column_names:
+            arrays.append(fact.column(col))
+            continue
+        name = next(name for name, table in tables.items() if col in table.column_names)
+        arrays.append(tables[name].column(col).take(fact.column(STAR_KEYS[name])))
+    return pa.table(arrays, names=list(columns))
+
+
+def convert_version(file_name):
+    """
+    Description: Converts a CSV version into the star schema of the store (see `normalize_version`), sorted by
+    Order Date (see `build_time_index`), once. The fact table is written as a memory-mappable Arrow file with the
+    column order and dimension sizes in its metadata. The conversion is skipped when the fact table is already
+    newer than the CSV.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector (e.g. 'Baseline.csv').
+
+    Return:
+    - `path` (str): The path of the fact table.
+    """
+    source = os.path.join(DATA_DIR, file_name)
+    target = store_path(file_name)
+
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+        return target
+
+    header = pd.read_csv(source, nrows=0).columns
+    df = pd.read_csv(source,
+                     dtype={col: 'str' for col, dtype in VERSION_DTYPES.items()
+                            if col in header and dtype == 'category'},  # keeps codes like '00386' as text
+                     parse_dates=[col for col in VERSION_DATE_COLUMNS if col in header])
+    df = apply_version_schema(df)
+    if TIME_COLUMN in df.columns:
+        df = df.sort_values(TIME_COLUMN, kind='stable', ignore_index=True)  # date ranges become row slices
+
+    fact, info = normalize_version(df)
+    table = pa.Table.from_pandas(fact, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[STORE_METADATA_KEY] = json.dumps(info).encode()
+    _write_arrow(table.replace_schema_metadata(metadata), target)
+    return target
+
+
+def read_snapshot_info(file_name):
+    """
+    Description: Reads the header of a delta simulation snapshot: the parent version, the simulation parameters
+    and the creation time.
+
+    Parameters:
+    - `file_name` (str): The name of the snapshot as listed in the Version selector.
+
+    Return:
+    - `info` (dict): A dictionary with the keys `'parent'`, `'params'` and `'created'`.
+    """
+    metadata = pq.read_schema(os.path.join(DATA_DIR, file_name)).metadata
+    return json.loads(metadata[SNAPSHOT_METADATA_KEY])
+
+
+@functools.lru_cache(maxsize=None)
+def _snapshot_parent(path, mtime):
+    """
+    Returns the parent version of a delta snapshot, read once per file and modification time.
+    """
+    return read_snapshot_info(os.path.basename(path))['parent']
+
+
+def version_mtime(file_name):
+    """
+    Description: Returns the modification time of a version. A delta snapshot is rebuilt from its parent version,
+    so its time is the newest of the parent chain: appending rows to a parent makes the derived data of its
+    snapshots out of date too.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `mtime` (float): The modification time, in seconds since the epoch.
+    """
+    source = os.path.join(DATA_DIR, file_name)
+    mtime = os.path.getmtime(source)
+    if file_name.endswith(DELTA_SUFFIX):
+        mtime = max(mtime, version_mtime(_snapshot_parent(os.path.abspath(source), mtime)))
+    return mtime
+
+
+def _version_entry(file_name):
+    """
+    Returns the process-wide cache entry of a version, creating it (and converting the CSV) on first use. The
+    entry is keyed by the modification time of the version along its parent chain (see `version_mtime`).
+    """
+    source = os.path.join(DATA_DIR, file_name)
+    key = (os.path.abspath(source), version_mtime(file_name))
+
+    entry = _version_cache.get(key)
+    if entry is not None:
+        return entry
+
+    with _version_lock:
+        entry = _version_cache.get(key)  # created by another thread while waiting
+        if entry is not None:
+            return entry
+
+        # Drop entries of older modification times of the same file
+        for old_key in [k for k in _version_cache if k[0] == key[0]]:
+            del _version_cache[old_key]
+
+        if file_name.endswith(DELTA_SUFFIX):
+            parent = read_snapshot_info(file_name)['parent']
+            entry = {'source': source, 'path': source, 'parent': parent, 'mtime': key[1],
+                     'columns': _version_entry(parent)['columns'], 'delta': pd.read_parquet(source), 'df': None}
+        else:
+            path = convert_version(file_name)
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            info = json.loads(table.schema.metadata[STORE_METADATA_KEY])
+            entry = {'source': source, 'path': path, 'parent': None, 'mtime': key[1], 'columns': info['columns'],
+                     'df': None, 'table': table, 'dimensions': info['dimensions']}
+        _version_cache[key] = entry
+
+    return entry
+
+
+def _read_columns(entry, columns):
+    """
+    Reads columns of a version. Base versions are read from the memory-mapped fact table, dimension attributes
+    are only joined when they are requested (see `join_dimensions`); delta snapshots are rebuilt by overlaying
+    the changed rows on the cached parent version (only the changed columns are copied).
+    """
+    if entry['parent'] is None:
+        table = join_dimensions(entry['table'], entry['dimensions'], columns)
+        return _share_categories(table.to_pandas(split_blocks=True))
+
+    df = load_version(entry['parent'], columns)
+    delta = entry['delta']
+    positions = version_row_index(entry['parent']).get_indexer(delta['Row ID'])
+    keep = positions >= 0  # Row IDs no longer in the parent are skipped, as in `insert_changes`
+
+    for col in columns:
+        if col in delta.columns and col != 'Row ID':
+            values = df[col].copy()
+            values.iloc[positions[keep]] = delta[col].to_numpy()[keep]
+            df[col] = values
+    return df
+
+
+@profiled()
+def load_version(file_name, columns=None):
+    """
+    Description: Loads a registered version from the dataset store. The CSV is converted on first use and the
+    loaded columns are kept in a process-wide cache keyed by path and modification time, so Streamlit reruns do
+    not parse the file again and all sessions share one copy. Base versions are memory-mapped, read-only
+    buffers: columns are only paged in when they are used and dimension attributes are only joined when they are
+    requested (see `normalize_version`). Delta simulation snapshots (see `save_simulation`)
+    are rebuilt on first use from their parent version.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector (e.g. 'Baseline.csv').
+    - `columns` (list, optional): The columns to load. All columns are loaded if not given.
+
+    Return:
+    - `df` (pandas.DataFrame): A shallow copy of the cached data, so adding columns does not alter the cache.
+    Changing values copies the changed column first (copy-on-write), the shared data is never modified.
+    """
+    entry = _version_entry(file_name)
+
+    wanted = entry['columns'] if columns is None else list(columns)
+
+    with _version_lock:
+        # Checked inside the lock, so a column read by another caller meanwhile is not added twice
+        cached = entry['df']
+        missing = list(dict.fromkeys(col for col in wanted if cached is None or col not in cached.columns))
+        if missing:
+            loaded = _read_columns(entry, missing)
+            cached = loaded if cached is None else pd.concat([cached, loaded], axis=1)
+            entry['df'] = cached
+
+    df = cached[wanted]
+    return df.copy(deep=False)
 
 
 def fill_selector(df, col_name):
     """
-    Description: generates a list of selectable options for a user interface element, such as a dropdown menu.
+    Description: generates a list of selectable options for a user interface element, such as a dropdown menu.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The DataFrame from which the function will extract unique values.
+    - `col_name` (str): The name of the column in the DataFrame from which unique values are to be retrieved.
+
+    Return:
+    - `choices_lst` (list): A list of unique values from the specified column, sorted in ascending order, with
+    `'All'` as the first item.
+    """
+    choices_lst = list(df[col_name].unique())  # Convert unique values to a list
+    choices_lst.sort()  # Sort the list in ascending order
+    choices_lst.insert(0, 'All')  # Insert 'All' at the beginning of the list
+    return choices_lst
+
+
+def select_name(df, level):
+    """
+    Description: Returns a list of selectable options for a given level, using the `fill_selector` function to
+    generate the list of options.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The DataFrame from which the function will extract unique values for the selected
+    level.
+    - `level` (str): The level of selection (e.g., 'All', 'Category', 'Product ID').
+
+    Return:
+    - `selection_options` (list): A list of selectable options for the user interface, either a placeholder
+    `['--']` if 'All' is selected, or a sorted list of unique values from the specified level.
+    """
+    if level == 'All':
+        return ['--']  # Return a placeholder for 'All'
+    else:
+        selection_options = fill_selector(df, level)
+        return selection_options
+    
+
+def apply_filter(df, col_name, selector):
+    """    
+    Description: Filters a DataFrame based on a specified column and selector value. If the selector is 'All',
+    no filtering is applied; otherwise, the DataFrame is filtered to include only the rows where the column's value
+    matches the selector.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The DataFrame to be filtered.
+    - `col_name` (str): The name of the column to apply the filter on.
+    - `selector` (str): The value to filter the column by. If 'All' is selected, no filtering is applied.
+
+    Return:
+    - `data_selection` (pandas.DataFrame): The filtered DataFrame based on the selector value. If 'All' is selected,
+    the original DataFrame is returned unmodified.
+    """
+    if selector != 'All':
+        data_selection = df[df[col_name] == selector]
+        return data_selection
+    else:
+        return df
+    
+
+# Dimension index
+
+DIMENSION_COLUMNS = ['Order Year', 'Category', 'Sub-Category', 'Product ID',
+                     'Region', 'State', 'City', 'Postal Code']
+
+
+def build_dimension_index(df, col_lst=DIMENSION_COLUMNS):
+    """
+    Description: Builds an index of the dimension columns used by the selectors. For every column it keeps the
+    sorted distinct values, the integer code of each row, and the row positions (postings) of each value.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The data of a version.
+    - `col_lst` (list): The dimension columns to index. Default is `DIMENSION_COLUMNS`.
+
+    Return:
+    - `index` (dict): For each column, a dictionary with `'values'` (sorted distinct values), `'codes'` (the code
+    of each row, -1 for missing values), `'order'` (row positions grouped by code) and `'offsets'` (where the
+    positions of each code start in `'order'`).
+    """
+    index = {}
+    for col in col_lst:
+        codes, values = pd.factorize(df[col], sort=True)
+        codes = codes.astype('int32')
+        counts = np.bincount(codes[codes >= 0], minlength=len(values))
+        offsets = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+        index[col] = {'values': np.asarray(values),
+                      'codes': codes,
+                      'order': np.argsort(codes, kind='stable'),
+                      'offsets': offsets}
+    index['rows'] = len(df)
+    return index
+
+
+@profiled()
+def version_dimension_index(file_name):
+    """
+    Description: Returns the dimension index of a version (see `build_dimension_index`), built once and kept with
+    the cached version.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `index` (dict): The dimension index.
+    """
+    entry = _version_entry(file_name)
+    with _version_lock:
+        if entry.get('dimension_index') is None:
+            entry['dimension_index'] = build_dimension_index(load_version(file_name, DIMENSION_COLUMNS))
+    return entry['dimension_index']
+
+
+@profiled()
+def dimension_positions(index, filters, rows=None):
+    """
+    Description: Returns the row positions matching all the given filters, using the postings of the dimension
+    index instead of scanning the data. Filters with the value 'All' are ignored.
+
+    Parameters:
+    - `index` (dict): The dimension index of the version.
+    - `filters` (list): A list of `(col_name, selector)` pairs, e.g. `[('Order Year', 2016), ('Region', 'West')]`.
+    - `rows` (tuple, optional): A `(first, stop)` slice of rows to restrict the positions to (e.g. a date range,
+    see `period_rows`).
+
+    Return:
+    - `positions` (numpy.ndarray): The matching row positions, in ascending order.
+    """
+    positions = None
+    for col_name, selector in filters:
+        if selector == 'All':
+            continue
+
+        dim = index[col_name]
+        code = np.searchsorted(dim['values'], selector)
+        if code == len(dim['values']) or dim['values'][code] != selector:
+            return np.array([], dtype='int64')
+
+        if positions is None:
+            positions = np.sort(dim['order'][dim['offsets'][code]:dim['offsets'][code + 1]])
+        else:
+            positions = positions[dim['codes'][positions] == code]
+
+    if positions is None:
+        positions = np.arange(index['rows']) if rows is None else np.arange(*rows)
+    elif rows is not None:
+        positions = positions[np.searchsorted(positions, rows[0]):np.searchsorted(positions, rows[1])]
+    return positions
+
+
+def dimension_options(index, col_name, positions=None):
+    """
+    Description: Same as `fill_selector`, but taken from the dimension index: the sorted distinct values of a
+    column among the given rows, with `'All'` as the first item.
+
+    Parameters:
+    - `index` (dict): The dimension index of the version.
+    - `col_name` (str): The name of the dimension column.
+    - `positions` (numpy.ndarray, optional): The row positions of the current selection. All rows if not given.
+
+    Return:
+    - `choices_lst` (list): The selectable options.
+    """
+    dim = index[col_name]
+    if positions is None:
+        values = dim['values']
+    else:
+        codes = dim['codes'][positions]
+        present = np.bincount(codes[codes >= 0], minlength=len(dim['values'])) > 0
+        values = dim['values'][present]
+    return ['All'] + values.tolist()
+
+
+def select_dimension_name(index, level, positions=None):
+    """
+    Description: Same as `select_name`, but taken from the dimension index.
+
+    Parameters:
+    - `index` (dict): The dimension index of the version.
+    - `level` (str): The level of selection (e.g., 'All', 'Category', 'Product ID').
+    - `positions` (numpy.ndarray, optional): The row positions of the current selection.
+
+    Return:
+    - `selection_options` (list): `['--']` if 'All' is selected, otherwise the options of the level.
+    """
+    if level == 'All':
+        return ['--']  # Return a placeholder for 'All'
+    else:
+        return dimension_options(index, level, positions)
+
+
+def round_cents(values, mode='ceil'):
+    """
+    Description: Rounds an array of values to cents in a single vectorized pass. NaN and infinite values are
+    passed through unchanged.
+
+    Parameters:
+    - `values` (array-like): The values to be rounded. Any shape is accepted (a column or a block of columns).
+    - `mode` (str): `'ceil'` rounds up to the next cent, the same as `math.ceil(x * 100) / 100`, which is the
+    rule used by the app. `'half_up'` rounds half away from zero on the decimal representation of the value, the
+    same as `Decimal(str(x)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)` in the `01_preliminary_etl`
+    notebook.
+
+    Return:
+    - `rounded` (numpy.ndarray): A float64 array with the rounded values.
+    """
+    values = np.asarray(values, dtype='float64')
+
+    with np.errstate(invalid='ignore', over='ignore'):
+        if mode == 'ceil':
+            # `+ 0.0` turns -0.0 into 0.0, as `math.ceil` returns the integer 0
+            return np.ceil(values * 100) / 100 + 0.0
+
+        if mode == 'half_up':
+            scaled = np.abs(values) * 100
+            rounded = np.floor(scaled + 0.5)
+
+            # Values close to a tie (e.g. 1.005 * 100 = 100.49999999999999) depend on the decimal representation,
+            # so these few are rounded with `Decimal` exactly like the notebook does
+            near_tie = np.isfinite(scaled) & (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+            for i in np.flatnonzero(near_tie):
+                exact = Decimal(str(values.flat[i])).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+                rounded.flat[i] = abs(exact) * 100
+
+            return np.copysign(rounded / 100, values)
+
+    raise ValueError(f"Unknown rounding mode '{mode}', expected 'ceil' or 'half_up'")
+
+
+def round_columns(df, col_lst, mode='ceil'):
+    """
+    Description: Converts the given columns to numeric and rounds them to cents with `round_cents`, as one block.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The DataFrame with the columns to be rounded. It is modified in place.
+    - `col_lst` (list): The names of the columns to be rounded.
+    - `mode` (str): The rounding mode, `'ceil'` (default) or `'half_up'`. See `round_cents`.
+
+    Return:
+    - `df` (pandas.DataFrame): The DataFrame with the rounded columns.
+    """
+    col_lst = list(col_lst)
+    block = df[col_lst].apply(pd.to_numeric, errors='coerce')
+    df[col_lst] = round_cents(block.to_numpy(dtype='float64'), mode)
+    return df
+
+
+def profit_calc(df, col_lst):
+    df['Net Price'] = df['List Price'] * (1 - df['Discount'])
+    df['Sales'] = df['Net Price'] * df['Quantity']
+    df['Profit'] = (df['Net Price'] - df['COGS']) * df['Quantity']
+    df['Gross Margin'] = df['Profit'] / df['Sales']
+    
+    # formatting
+    df = round_columns(df, col_lst)
+
+    return df
+
+
+def gross_margin_calc(df, col_lst):
+    df['Net Price'] = df['COGS'] / (1 - df['Gross Margin'])
+    df['Sales'] = df['Net Price'] * df['Quantity']
+    df['List Price'] = df['Net Price'] / (1 - df['Discount'])
+    df['Profit'] = (df['Net Price'] - df['COGS']) * df['Quantity']
+    df['Gross Margin'] = df['Profit'] / df['Sales']
+    
+    # formatting
+    df = round_columns(df, col_lst)
+
+    return df
+
+
+SUMMARY_MEASURES = ['Quantity', 'Sales', 'Discount Value', 'Total COGS', 'Profit']
+
+
+def summary_totals(df, version_str, selected_year):
+    """
+    Description: Aggregates the additive measures used by `summary_tab` (Quantity, Sales, Discount Value,
+    Total COGS and Profit). These totals can be added and subtracted, see `combine_totals`.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The DataFrame containing the financial data.
+    - `version_str` (str): The name of the version, used as index of the result (e.g. 'Baseline').
+    - `selected_year` (int or str): The 'Order Year' to aggregate, or 'All'.
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): One row per version with the additive measures (no row if `df` is empty).
+    """
+    # Step 1: Filter by 'Order Year'
+
+    if selected_year != 'All':
+        df = df[df['Order Year'] == selected_year]
+    else:
+        pass
+    
+    # Step 2: Add the 'Title' column
+    # Step 3: Calculate Discount and COGS Total value
+    df = df.assign(**{'Version': version_str,
+                      'Discount Value': df['Discount'] * df['List Price'] * df['Quantity'],
+                      'Total COGS': df['COGS'] * df['Quantity']})
+    
+    # Step 4: Group the data by 'Title' and aggregate the numeric columns
+    return df.groupby(['Version'])[SUMMARY_MEASURES].sum()
+
+
+@profiled()
+def summary_metrics(df_grouped):
+    """
+    Description: Derives the ratio metrics (Net Price, COGS, List Price, Disc. % and GM %) from the additive
+    totals returned by `summary_totals`, reorders and rounds the columns.
+
+    Parameters:
+    - `df_grouped` (pandas.DataFrame): The additive totals, one row per version.
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): The summary table as shown in the app.
+    """
+    df_grouped = df_grouped.copy()
+
+    # Step 5: Calculate the rest of financial metrics
+    df_grouped['Net Price'] = df_grouped['Sales'] / df_grouped['Quantity']
+    df_grouped['COGS'] = (df_grouped['Sales'] - df_grouped['Profit']) / df_grouped['Quantity']
+    df_grouped['List Price'] = (df_grouped['Sales'] + df_grouped['Discount Value']) / df_grouped['Quantity']
+    df_grouped['Disc. %'] = np.where(df_grouped['List Price'] != 0, 
+                                 1 - (df_grouped['Net Price'] / df_grouped['List Price']), 
+                                 0)
+    df_grouped['GM %'] = df_grouped['Profit'] / df_grouped['Sales']
+        
+    # Step 6: Reorder the columns
+    new_column_order = ['COGS', 'List Price', 'Net Price', 'Disc. %', 'Quantity', 'Sales', 'Total COGS', 'Profit', 'GM %']
+    df_grouped = df_grouped[new_column_order]
+    
+    # Step 7: Round the values in the DataFrame
+    df_grouped = round_columns(df_grouped, df_grouped.columns)
+    
+    return df_grouped
+
+
+def summary_tab(df, version_str, selected_year, group_by=None):
+    """
+    This function takes a DataFrame 'df' containing financial data and performs various calculations
+    such as adjusting the 'List Price', calculating 'Discount Value', 'Net Price', 'COGS', 'Gross Margin',
+    and performing group-by operations. It returns a DataFrame with the aggregated results and rounded values.
+    With `group_by` (a list of columns, e.g. `['Region']`), the results are broken down by those columns
+    (see `grouped_totals`).
+    """
+    if group_by:
+        return summary_metrics(grouped_totals([(version_str, df)], group_by, selected_year))
+    return summary_metrics(summary_totals(df, version_str, selected_year))
+
+
+def grouped_totals(frames, group_by, selected_year='All'):
+    """
+    Description: Aggregates the additive measures of `summary_totals` per version and group, for several
+    versions in a single grouped aggregation over the concatenated frames. Each group column is turned into
+    integer codes (the codes of categorical columns are used as they are) and the codes are combined into one
+    group key, so the aggregation never sorts the groups.
+
+    Parameters:
+    - `frames` (list): `(version_str, df)` pairs, e.g. `[('Baseline', selection), ('Simulation', simulation)]`.
+    - `group_by` (list): The columns to break the totals down by (e.g. `['Region', 'Category']`).
+    - `selected_year` (int or str): The 'Order Year' to aggregate, or 'All'.
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): One row per version and group with the additive measures, indexed by
+    'Version' and the group columns, in order of first appearance. To be passed to `summary_metrics`.
+    """
+    columns = list(dict.fromkeys(_TOTALS_INPUT_COLUMNS + list(group_by) + ['Order Year']))
+    df = pd.concat([frame[[col for col in columns if col in frame.columns]] for _, frame in frames],
+                   ignore_index=True)
+    versions = np.repeat(np.arange(len(frames)), [len(frame) for _, frame in frames])
+
+    if selected_year != 'All':
+        keep = (df['Order Year'] == selected_year).to_numpy()
+        df, versions = df[keep], versions[keep]
+
+    # One integer key per (version, group), without sorting
+    codes, sizes = [versions], [len(frames)]
+    for col in group_by:
+        col_codes, col_values = pd.factorize(df[col], sort=False, use_na_sentinel=False)
+        codes.append(col_codes)
+        sizes.append(max(len(col_values), 1))
+    key = np.ravel_multi_index(codes, sizes) if len(df) else np.zeros(0, dtype='int64')
+    group_ids, _ = pd.factorize(key, sort=False)
+
+    measures = pd.DataFrame({'Quantity': df['Quantity'].to_numpy(),
+                             'Sales': df['Sales'].to_numpy(),
+                             'Discount Value': (df['Discount'] * df['List Price'] * df['Quantity']).to_numpy(),
+                             'Total COGS': (df['COGS'] * df['Quantity']).to_numpy(),
+                             'Profit': df['Profit'].to_numpy()})
+    df_grouped = measures.groupby(group_ids, sort=False).sum()
+
+    # Labels of each group, from its first row
+    first = np.full(len(df_grouped), len(group_ids))
+    np.minimum.at(first, group_ids, np.arange(len(group_ids)))
+    labels = {'Version': np.array([version_str for version_str, _ in frames], dtype=object)[versions[first]]}
+    for col in group_by:
+        labels[col] = df[col].to_numpy()[first]
+    df_grouped.index = pd.MultiIndex.from_arrays(list(labels.values()), names=list(labels))
+    return df_grouped
+
+
+def top_groups(summary, n, by='Profit', bottom=False, version_str=None):
+    """
+    Description: Keeps the `n` groups with the highest (or lowest) value of a metric in a grouped summary (see
+    `summary_tab` with `group_by`), for all versions. Only the selected groups are sorted (`numpy.argpartition`).
+
+    Parameters:
+    - `summary` (pandas.DataFrame): The grouped summary, indexed by 'Version' and the group columns.
+    - `n` (int): The number of groups to keep.
+    - `by` (str): The metric to rank by, e.g. 'Profit' or 'GM %'. Default is 'Profit'.
+    - `bottom` (bool): Keep the lowest values instead of the highest. Default is False.
+    - `version_str` (str, optional): The version whose values rank the groups. Default is the first version.
+
+    Return:
+    - `summary` (pandas.DataFrame): The rows of the selected groups, ranked, grouped by version.
+    """
+    versions = summary.index.get_level_values('Version')
+    version_str = versions[0] if version_str is None and len(summary) else version_str
+    ranked = summary[versions == version_str]
+
+    values = ranked[by].to_numpy(dtype='float64')
+    values = np.where(np.isnan(values), np.inf if bottom else -np.inf, values)  # missing values rank last
+    values = values if bottom else -values
+    n = min(n, len(values))
+    selected = np.argpartition(values, n - 1)[:n] if 0 < n < len(values) else np.arange(n)
+    selected = selected[np.argsort(values[selected], kind='stable')]
+
+    # Rows of the selected groups, by version and rank
+    groups = ranked.index.droplevel('Version')[selected]
+    rank = groups.get_indexer(summary.index.droplevel('Version'))
+    keep = np.flatnonzero(rank >= 0)
+    order = keep[np.lexsort((rank[keep], pd.factorize(versions)[0][keep]))]
+    return summary.iloc[order]
+
+
+def combine_totals(total, removed, added, version_str):
+    """
+    Description: Computes the totals of a version where some rows were replaced, without building the merged
+    data: `total + (added - removed)`. Used for the "Total Business including Selection" view, where the
+    simulated total is the baseline total minus the baseline selection plus the simulated selection.
+
+    Parameters:
+    - `total` (pandas.DataFrame): The totals of the whole version, from `summary_totals`.
+    - `removed` (pandas.DataFrame): The totals of the replaced rows (e.g. the baseline selection).
+    - `added` (pandas.DataFrame): The totals of the new rows (e.g. the simulated selection).
+    - `version_str` (str): The name of the resulting version (e.g. 'Simulation').
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): One row with the combined additive measures, to be passed to
+    `summary_metrics`.
+    """
+    change = added[SUMMARY_MEASURES].sum() - removed[SUMMARY_MEASURES].sum()
+    return apply_totals_change(total, change, version_str)
+
+
+def _row_measures(df):
+    """
+    Returns the additive measures of `SUMMARY_MEASURES` of each row.
+    """
+    return pd.DataFrame({'Quantity': df['Quantity'],
+                         'Sales': df['Sales'],
+                         'Discount Value': df['Discount'] * df['List Price'] * df['Quantity'],
+                         'Total COGS': df['COGS'] * df['Quantity'],
+                         'Profit': df['Profit']})
+
+
+def totals_change(before_df, after_df):
+    """
+    Description: Computes the change of the additive measures between two versions of the same rows, e.g. the
+    baseline selection and its simulation. The difference is taken row by row, so measures that were not
+    changed add up to exactly zero.
+
+    Parameters:
+    - `before_df` (pandas.DataFrame): The rows before the change.
+    - `after_df` (pandas.DataFrame): The same rows (same index) after the change.
+
+    Return:
+    - `change` (pandas.Series): The change of each measure in `SUMMARY_MEASURES`.
+    """
+    return (_row_measures(after_df) - _row_measures(before_df)).sum()
+
+
+def apply_totals_change(totals, change, version_str):
+    """
+    Description: Adds a change of the additive measures (see `totals_change`) to the totals of a version.
+    The change is added last, so measures that did not change keep the exact totals.
+
+    Parameters:
+    - `totals` (pandas.DataFrame): The totals, from `summary_totals` or `cube_totals`.
+    - `change` (pandas.Series): The change of each measure.
+    - `version_str` (str): The name of the resulting version (e.g. 'Simulation').
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): One row with the changed measures (no row if `totals` is empty).
+    """
+    if totals.empty:
+        return pd.DataFrame(columns=SUMMARY_MEASURES, index=pd.Index([], name='Version'))
+
+    combined = totals[SUMMARY_MEASURES].sum() + change[SUMMARY_MEASURES]
+    return pd.DataFrame([combined], index=pd.Index([version_str], name='Version'))
+
+
+# Time index
+
+TIME_COLUMN = 'Order Date'
+PERIODS = ['All', 'Q1', 'Q2', 'Q3', 'Q4', 'YTD', 'Rolling 12 months']
+
+
+def build_time_index(df, col_name=TIME_COLUMN):
+    """
+    Description: Builds the time index of a version stored in date order (see `convert_version`): the dates of
+    the rows and, for every calendar month from the first to the last date, the position of its first row.
+    The rows of any date range are then a contiguous slice, found by binary search.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The data of a version, sorted by `col_name`.
+    - `col_name` (str): The date column. Default is `TIME_COLUMN`.
+
+    Return:
+    - `index` (dict): `'dates'` (the sorted dates), `'months'` (the months, as `datetime64[M]`) and `'offsets'`
+    (where the rows of each month start, with the number of rows at the end).
+    """
+    dates = df[col_name].to_numpy(dtype='datetime64[ns]')
+    if len(dates) and (dates[1:] < dates[:-1]).any():
+        raise ValueError(f"The rows are not sorted by '{col_name}'")
+
+    if len(dates):
+        months = np.arange(dates[0].astype('datetime64[M]'), dates[-1].astype('datetime64[M]') + 1)
+    else:
+        months = np.array([], dtype='datetime64[M]')
+    offsets = np.append(np.searchsorted(dates, months.astype('datetime64[ns]')), len(dates))
+    return {'dates': dates, 'months': months, 'offsets': offsets}
+
+
+def version_time_index(file_name):
+    """
+    Description: Returns the time index of a version (see `build_time_index`), built once and kept with the
+    cached version.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `index` (dict): The time index.
+    """
+    entry = _version_entry(file_name)
+    with _version_lock:
+        if entry.get('time_index') is None:
+            entry['time_index'] = build_time_index(load_version(file_name, [TIME_COLUMN]))
+    return entry['time_index']
+
+
+def date_rows(index, start=None, end=None):
+    """
+    Description: Returns the slice of rows between two dates (both included), by binary search on the time index.
+
+    Parameters:
+    - `index` (dict): The time index of the version.
+    - `start` (str or datetime, optional): The first day. Default is the first date.
+    - `end` (str or datetime, optional): The last day. Default is the last date.
+
+    Return:
+    - `rows` (tuple): `(first, stop)` row positions, so the rows are `first <= position < stop`.
+    """
+    dates = index['dates']
+    first = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start).normalize(), 'ns'))
+    stop = len(dates) if end is None else np.searchsorted(
+        dates, np.datetime64(pd.Timestamp(end).normalize() + pd.Timedelta(days=1), 'ns'))
+    return int(first), int(max(first, stop))
+
+
+def period_rows(index, period, year='All'):
+    """
+    Description: Returns the slice of rows of a period of the Period selector, within the selected year.
+    Quarters are those of the selected year (the last year if 'All'); 'YTD' and 'Rolling 12 months' end at the
+    last order date of the selected year (of the version if 'All'). A rolling window is not clamped to the
+    calendar year: it starts in the year before unless the year ends on December 31.
+
+    Parameters:
+    - `index` (dict): The time index of the version.
+    - `period` (str): One of `PERIODS`.
+    - `year` (int or str): The selected 'Order Year', or 'All'.
+
+    Return:
+    - `rows` (tuple): `(first, stop)` row positions, or None for 'All' years and periods (no restriction).
+    """
+    dates = index['dates']
+    if (period == 'All' and year == 'All') or not len(dates):
+        return None
+
+    if year == 'All':
+        first, stop = 0, len(dates)
+        year = pd.Timestamp(dates[-1]).year
+    else:
+        first, stop = date_rows(index, f'{year}-01-01', f'{year}-12-31')
+
+    if period == 'All':
+        return first, stop
+    if period in ('Q1', 'Q2', 'Q3', 'Q4'):
+        quarter = pd.Period(f'{year}{period}', freq='Q')
+        window = date_rows(index, quarter.start_time, quarter.end_time)
+    else:
+        last = pd.Timestamp(dates[stop - 1]) if stop > first else pd.Timestamp(f'{year}-12-31')
+        start = pd.Timestamp(f'{last.year}-01-01') if period == 'YTD' else last - pd.DateOffset(years=1) + pd.Timedelta(days=1)
+        window = date_rows(index, start, last)
+        if period == 'Rolling 12 months':
+            return window
+    return max(first, window[0]), max(max(first, window[0]), min(stop, window[1]))
+
+
+def _month_codes(index, positions):
+    """
+    Returns the month (position in `index['months']`) of each row position.
+    """
+    return np.searchsorted(index['offsets'], positions, side='right') - 1
+
+
+def build_monthly_totals(df, index):
+    """
+    Description: Aggregates the additive measures of `SUMMARY_MEASURES` per calendar month. The rows of each
+    month are contiguous in a version stored in date order, so every month is one reduction over a slice.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The data of the version, in stored order.
+    - `index` (dict): The time index of the version.
+
+    Return:
+    - `monthly` (pandas.DataFrame): One row per month (including months without orders), indexed by 'Month'.
+    """
+    measures = _row_measures(df).to_numpy(dtype='float64')
+    starts = index['offsets'][:-1]
+    totals = np.zeros((len(starts), len(SUMMARY_MEASURES)))
+    filled = starts < index['offsets'][1:]
+    if filled.any():
+        totals[filled] = np.add.reduceat(measures, starts[filled], axis=0)
+    return pd.DataFrame(totals, columns=SUMMARY_MEASURES,
+                        index=pd.DatetimeIndex(index['months'].astype('datetime64[ns]'), name='Month'))
+
+
+def version_monthly_totals(file_name):
+    """
+    Description: Returns the monthly totals of a version (see `build_monthly_totals`), built once and kept with
+    the cached version.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `monthly` (pandas.DataFrame): The totals per month.
+    """
+    entry = _version_entry(file_name)
+    with _version_lock:
+        if entry.get('monthly') is None:
+            entry['monthly'] = build_monthly_totals(load_version(file_name, _TOTALS_INPUT_COLUMNS),
+                                                    version_time_index(file_name))
+    return entry['monthly']
+
+
+@profiled()
+def monthly_trend(file_name, overlay=None, positions=None, rows=None):
+    """
+    Description: Returns the monthly Sales and Profit of the baseline and of a simulation. For a slice of rows
+    (e.g. from `period_rows`), whole months come from the precomputed monthly totals and only the partial months
+    at the ends of the slice are summed from rows. For a selection (row positions), the selected rows are summed
+    per month. The simulation adds the changes of the overlay rows to the baseline months.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+    - `overlay` (dict, optional): The simulation overlay, from `simulation_overlay`.
+    - `positions` (numpy.ndarray, optional): The row positions of a selection.
+    - `rows` (tuple, optional): A `(first, stop)` slice of rows, used when no positions are given. All rows by
+    default.
+
+    Return:
+    - `trend` (pandas.DataFrame): 'Month', 'Version' ('Baseline', 'Simulation'), 'Sales' and 'Profit', one row
+    per version and month of the selection or slice.
+    """
+    index = version_time_index(file_name)
+    n_months = len(index['months'])
+    offsets = index['offsets']
+
+    if positions is not None:
+        selected = load_version(file_name, _TOTALS_INPUT_COLUMNS).take(positions)
+        baseline = np.zeros((n_months, len(SUMMARY_MEASURES)))
+        codes = _month_codes(index, positions)
+        for i, measure in enumerate(_row_measures(selected).to_numpy(dtype='float64').T):
+            baseline[:, i] = np.bincount(codes, measure, minlength=n_months)
+        months = np.unique(codes)
+    else:
+        first, stop = (0, len(index['dates'])) if rows is None else rows
+        baseline = version_monthly_totals(file_name).to_numpy().copy()
+        months = np.arange(_month_codes(index, first), _month_codes(index, max(first, stop - 1)) + 1) \
+            if stop > first else np.array([], dtype='int64')
+        for month in months[[0, -1]] if len(months) else []:
+            start, end = max(first, offsets[month]), min(stop, offsets[month + 1])
+            if start > offsets[month] or end < offsets[month + 1]:  # partial month
+                part = load_version(file_name, _TOTALS_INPUT_COLUMNS).iloc[start:end]
+                baseline[month] = _row_measures(part).to_numpy(dtype='float64').sum(axis=0)
+
+    simulation = baseline.copy()
+    if overlay is not None and overlay['columns']:
+        overlay_positions = overlay['positions']
+        if positions is not None:
+            keep = np.isin(overlay_positions, positions)
+        else:
+            keep = (overlay_positions >= first) & (overlay_positions < stop)
+        before = load_version(file_name, _TOTALS_INPUT_COLUMNS).take(overlay_positions[keep])
+        after = read_overlay(overlay, _TOTALS_INPUT_COLUMNS).iloc[np.flatnonzero(keep)]
+        change = (_row_measures(after).to_numpy(dtype='float64') - _row_measures(before).to_numpy(dtype='float64'))
+        codes = _month_codes(index, overlay_positions[keep])
+        for i in range(len(SUMMARY_MEASURES)):
+            simulation[:, i] += np.bincount(codes, change[:, i], minlength=n_months)
+
+    month_index = pd.DatetimeIndex(index['months'][months].astype('datetime64[ns]'))
+    frames = [pd.DataFrame({'Month': month_index, 'Version': version_str,
+                            'Sales': totals[months, SUMMARY_MEASURES.index('Sales')],
+                            'Profit': totals[months, SUMMARY_MEASURES.index('Profit')]})
+              for version_str, totals in [('Baseline', baseline), ('Simulation', simulation)]]
+    trend = pd.concat(frames, ignore_index=True)
+    return round_columns(trend, ['Sales', 'Profit'])
+
+
+def selection_totals(file_name, filters, version_str, rows=None):
+    """
+    Description: Same result as `summary_totals` on the filtered data of a version, restricted to a slice of
+    rows (e.g. a period, see `period_rows`). Without a slice, the totals are rolled up from the aggregate cube
+    (see `cube_totals`); with one, the selected rows of the slice are summed.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+    - `filters` (list): A list of `(col_name, selector)` pairs over `DIMENSION_COLUMNS`.
+    - `version_str` (str): The name of the version, used as index of the result (e.g. 'Baseline').
+    - `rows` (tuple, optional): A `(first, stop)` slice of rows.
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): One row with the additive measures (no row if nothing matches).
+    """
+    if rows is None:
+        return cube_totals(file_name, filters, version_str)
+
+    positions = dimension_positions(version_dimension_index(file_name), filters, rows)
+    selected = load_version(file_name, _TOTALS_INPUT_COLUMNS).take(positions)
+    if selected.empty:
+        return pd.DataFrame(columns=SUMMARY_MEASURES, index=pd.Index([], name='Version'))
+    return summary_totals(selected, version_str, 'All')
+
+
+def trend_charts(df, df_name='df'):
+    """
+    Function to display the monthly 'Sales' and 'Profit' trend lines of the baseline and the simulation side by
+    side, colored based on the 'Version'.
+
+    Parameters:
+    df (pd.DataFrame): The monthly trend, from `monthly_trend`.
+    df_name (str): A unique name or identifier for the DataFrame, used to create unique chart keys. Default is 'df'.
+    """
+    col1, col2 = st.columns(2)
+    for col, measure in zip((col1, col2), ('Sales', 'Profit')):
+        with col:
+            fig = px.line(df, x='Month', y=measure, color='Version', height=300, markers=len(df) < 60)
+            fig.update_layout(title={'text': f'Monthly {measure}', 'x': 0.5, 'xanchor': 'center'},
+                              xaxis_title="", yaxis_title="", legend_title_text="")
+            st.plotly_chart(fig, key=f'{df_name}_{measure.lower()}_trend')
+
+
+# Aggregate cube
+
+def cube_path(file_name):
+    """
+    Description: Returns the path of the stored aggregate cube of a version, next to its fact table. Like the
+    fact table, the name holds `STORE_SCHEMA_VERSION`, so a cube written with an older schema is built again.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `path` (str): The path of the cube file inside `STORE_DIR`.
+    """
+    return os.path.join(STORE_DIR, os.path.splitext(file_name)[0] + f'.v{STORE_SCHEMA_VERSION}.cube.parquet')
+
+
+def build_cube(df):
+    """
+    Description: Pre-aggregates the additive measures of `summary_totals` over Order Year x product hierarchy x
+    geography hierarchy (the `DIMENSION_COLUMNS`). Any selection of the app is a set of cells of the cube.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The data of a version.
+
+    Return:
+    - `cube` (pandas.DataFrame): One row per cell, with the dimension columns and the summed measures.
+    """
+    df = df.assign(**{'Discount Value': df['Discount'] * df['List Price'] * df['Quantity'],
+                      'Total COGS': df['COGS'] * df['Quantity']})
+    cube = df.groupby(DIMENSION_COLUMNS, dropna=False, sort=False, observed=True)[SUMMARY_MEASURES].sum()
+    return cube.reset_index()
+
+
+def version_cube(file_name):
+    """
+    Description: Returns the aggregate cube of a version (see `build_cube`) and its dimension index. The cube is
+    built once, stored next to the dataset and kept with the cached version.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `cube` (pandas.DataFrame): The aggregate cube.
+    - `cube_index` (dict): The dimension index of the cube cells.
+    """
+    entry = _version_entry(file_name)
+    with _version_lock:
+        if entry.get('cube') is None:
+            path = cube_path(file_name)
+            if os.path.exists(path) and os.path.getmtime(path) >= entry['mtime']:
+                cube = pd.read_parquet(path)
+            else:
+                cube = build_cube(load_version(file_name, DIMENSION_COLUMNS + ['Quantity', 'Sales', 'Discount',
+                                                                              'List Price', 'COGS', 'Profit']))
+                _write_parquet(cube, path)
+            entry['cube'] = (cube, build_dimension_index(cube))
+    return entry['cube']
+
+
+@profiled()
+def cube_totals(file_name, filters, version_str):
+    """
+    Description: Same result as `summary_totals` on the filtered data of a version, but rolled up from the
+    aggregate cube instead of scanning the rows.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+    - `filters` (list): A list of `(col_name, selector)` pairs over `DIMENSION_COLUMNS`, e.g.
+    `[('Order Year', 2016), ('Region', 'West')]`. Filters with the value 'All' are ignored.
+    - `version_str` (str): The name of the version, used as index of the result (e.g. 'Baseline').
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): One row with the additive measures (no row if nothing matches).
+    """
+    cube, cube_index = version_cube(file_name)
+    cells = cube.take(dimension_positions(cube_index, filters))
+
+    if cells.empty:
+        return pd.DataFrame(columns=SUMMARY_MEASURES, index=pd.Index([], name='Version'))
+    return pd.DataFrame([cells[SUMMARY_MEASURES].sum()], index=pd.Index([version_str], name='Version'))
+
+
+# Partitioned aggregation
+
+PARTITION_COLUMNS = ['Order Year', 'Order Month']
+PARTITION_ROW_GROUP_SIZE = 100000
+_TOTALS_INPUT_COLUMNS = ['Quantity', 'Sales', 'Discount', 'List Price', 'COGS', 'Profit']
+
+
+def partition_path(file_name):
+    """
+    Description: Returns the folder of the partitioned copy of a version (one Parquet file per Order Year and
+    Order Month), next to its fact table, with `STORE_SCHEMA_VERSION` in its name like the cube.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `path` (str): The folder inside `STORE_DIR`.
+    """
+    return os.path.join(STORE_DIR, os.path.splitext(file_name)[0] + f'.v{STORE_SCHEMA_VERSION}.partitions')
+
+
+def partition_version(file_name):
+    """
+    Description: Writes a version as a Parquet dataset partitioned by Order Year and Order Month
+    ('<folder>/Order Year=2016/Order Month=11/...'), once. The data is streamed in record batches from the
+    fact table of the version (joined with its dimensions batch by batch), so it never has to fit in memory;
+    delta snapshots are written from their rebuilt data.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `path` (str): The folder of the partitioned dataset.
+    """
+    entry = _version_entry(file_name)
+    path = partition_path(file_name)
+    if os.path.exists(path) and os.path.getmtime(path) >= entry['mtime']:
+        return path
+
+    if entry['parent'] is None:
+        batches = (batch for chunk in entry['table'].to_batches(max_chunksize=PARTITION_ROW_GROUP_SIZE)
+                   for batch in join_dimensions(pa.Table.from_batches([chunk]), entry['dimensions'],
+                                                entry['columns']).to_batches())
+        schema = join_dimensions(entry['table'].slice(0, 0), entry['dimensions'], entry['columns']).schema
+        data = pa.RecordBatchReader.from_batches(schema, batches)
+    else:
+        data = pa.Table.from_pandas(load_version(file_name), preserve_index=False)
+
+    partitioning = ds.partitioning(pa.schema([(col, data.schema.field(col).type) for col in PARTITION_COLUMNS]),
+                                   flavor='hive')
+    ds.write_dataset(data, path, format='parquet', partitioning=partitioning, existing_data_behavior='delete_matching',
+                     max_rows_per_group=PARTITION_ROW_GROUP_SIZE)
+    os.utime(path)
+    return path
+
+
+def _partition_tasks(path, selected_year, partition_by):
+    """
+    Lists the work units of a partitioned version: one per year, per month or per row group of each file.
+    Partitions of other years are skipped without being read.
+    """
+    files = []
+    for root, _, names in os.walk(path):
+        parts = dict(part.split('=', 1) for part in os.path.relpath(root, path).split(os.sep) if '=' in part)
+        if selected_year != 'All' and parts.get('Order Year') != str(selected_year):
+            continue
+        files += [(parts.get('Order Year'), os.path.join(root, name)) for name in sorted(names)]
+
+    if partition_by == 'Order Year':
+        years = {}
+        for year, file in files:
+            years.setdefault(year, []).append((file, None))
+        return list(years.values())
+    if partition_by == 'Order Month':
+        return [[(file, None)] for _, file in files]
+    if partition_by == 'rows':
+        return [[(file, [group])] for _, file in files for group in range(pq.ParquetFile(file).num_row_groups)]
+    raise ValueError(f"Unknown partitioning '{partition_by}', expected 'Order Year', 'Order Month' or 'rows'")
+
+
+def _partition_totals(task):
+    """
+    Sums the additive measures of `summary_totals` over the files (or row groups) of one work unit, reading only
+    the columns they need. Returns the sums and the number of rows.
+    """
+    sums = np.zeros(len(SUMMARY_MEASURES))
+    rows = 0
+    for file, row_groups in task:
+        source = pq.ParquetFile(file)
+        if row_groups is None:
+            df = source.read(columns=_TOTALS_INPUT_COLUMNS).to_pandas()
+        else:
+            df = source.read_row_groups(row_groups, columns=_TOTALS_INPUT_COLUMNS).to_pandas()
+        sums += [df['Quantity'].sum(),
+                 df['Sales'].sum(),
+                 (df['Discount'] * df['List Price'] * df['Quantity']).sum(),
+                 (df['COGS'] * df['Quantity']).sum(),
+                 df['Profit'].sum()]
+        rows += len(df)
+    return sums, rows
+
+
+def partitioned_totals(file_name, version_str, selected_year, partition_by='Order Month', processes=None):
+    """
+    Description: Same result as `summary_totals` on a whole version, computed from its partitioned copy on disk
+    (see `partition_version`) in a process pool: every partition is summed in a worker, reading only the
+    columns it needs, and the partial sums are merged. Only the partitions of the selected year are read.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+    - `version_str` (str): The name of the version, used as index of the result (e.g. 'Baseline').
+    - `selected_year` (int or str): The 'Order Year' to aggregate, or 'All'.
+    - `partition_by` (str): The work unit: 'Order Year', 'Order Month' (default) or 'rows' (row groups of
+    `PARTITION_ROW_GROUP_SIZE` rows).
+    - `processes` (int, optional): The number of worker processes. Default is the number of CPUs; 1 runs the
+    partitions in the current process.
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): One row with the additive measures (no row if nothing matches).
+    """
+    tasks = _partition_tasks(partition_version(file_name), selected_year, partition_by)
+
+    if processes == 1 or len(tasks) <= 1:
+        results = [_partition_totals(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_partition_totals, tasks))
+
+    if sum(rows for _, rows in results) == 0:
+        return pd.DataFrame(columns=SUMMARY_MEASURES, index=pd.Index([], name='Version'))
+
+    sums = np.sum([partial for partial, _ in results], axis=0)
+    return pd.DataFrame([sums], columns=SUMMARY_MEASURES, index=pd.Index([version_str], name='Version'))
+
+
+def summary_tab_partitioned(file_name, version_str, selected_year, partition_by='Order Month', processes=None):
+    """
+    Description: Same table as `summary_tab` on a whole version, aggregated out of core and on all cores with
+    `partitioned_totals`. The ratio metrics are derived after the partial sums are merged.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+    - `version_str` (str): The name of the version (e.g. 'Baseline').
+    - `selected_year` (int or str): The 'Order Year' to aggregate, or 'All'.
+    - `partition_by` (str): 'Order Year', 'Order Month' (default) or 'rows'.
+    - `processes` (int, optional): The number of worker processes. Default is the number of CPUs.
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): The summary table.
+    """
+    return summary_metrics(partitioned_totals(file_name, version_str, selected_year, partition_by, processes))
+
+
+# Incremental ingestion
+
+def append_version(file_name, rows):
+    """
+    Description: Appends new order lines to a version and refreshes only the derived data they affect, instead
+    of converting the whole version again. The rows are appended to the CSV and normalized into the store (only
+    dimension rows that are not stored yet are added, see `normalize_version`), then merged into the fact table
+    in Order Date order. In the stored aggregate cube, only the cells of the affected years are recomputed; in
+    the partitioned copy, only the affected months are rewritten. The in-memory indexes are rebuilt on next use.
+
+    Parameters:
+    - `file_name` (str): The name of a version as listed in the Version selector (not a delta snapshot).
+    - `rows` (pandas.DataFrame): The new order lines, with the columns of the version (see `etl.transform`).
+
+    Return:
+    - `months` (list): The affected months, as 'YYYY-MM'.
+    """
+    entry = _version_entry(file_name)
+    if entry['parent'] is not None:
+        raise ValueError(f"'{file_name}' is a delta snapshot, rows can only be appended to a base version")
+
+    missing = [col for col in entry['columns'] if col not in rows.columns]
+    extra = [col for col in rows.columns if col not in entry['columns']]
+    if missing or extra:
+        raise ValueError(f"The columns of the rows do not match '{file_name}': missing {missing}, "
+                         f"unexpected {extra}")
+
+    row_ids = rows['Row ID']
+    duplicates = row_ids[row_ids.duplicated() | row_ids.isin(version_row_index(file_name))]
+    if len(duplicates):
+        raise ValueError(f"Row IDs already used in '{file_name}': {sorted(duplicates.unique().tolist())[:10]}")
+
+    rows = rows[entry['columns']].reset_index(drop=True)
+    df = apply_version_schema(rows.assign(**{col: pd.to_datetime(rows[col]) for col in VERSION_DATE_COLUMNS
+                                             if col in rows.columns}))
+    dated = TIME_COLUMN in df.columns
+    if dated:
+        df = df.sort_values(TIME_COLUMN, kind='stable', ignore_index=True)
+        old_dates = version_time_index(file_name)['dates']
+
+    # Derived data that is up to date before the append can be refreshed in part afterwards
+    source = entry['source']
+    fresh = {path for path in [cube_path(file_name), partition_path(file_name)]
+             if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)}
+
+    fact, info = normalize_version(df)
+    same_layout = (sorted(fact.columns) == sorted(entry['table'].column_names)
+                   and info['dimensions'].keys() == entry['dimensions'].keys())
+    if same_layout:
+        fact = apply_version_schema(pd.concat([entry['table'].to_pandas(), fact], ignore_index=True))
+    else:
+        # Some attributes of the new rows do not match the stored dimensions: normalize the whole version again
+        fact, info = normalize_version(pd.concat([load_version(file_name), df], ignore_index=True))
+    info['columns'] = entry['columns']
+    new_dates = df[TIME_COLUMN].to_numpy(dtype='datetime64[ns]') if dated else None
+    if dated and len(old_dates) and len(new_dates) and new_dates[0] < old_dates[-1]:
+        order = np.argsort(np.concatenate([old_dates, new_dates]), kind='stable')  # as a stable sort of the version
+        fact = fact.take(order).reset_index(drop=True)
+
+    # The CSV first: if the fact table is not written, the version is converted again on next use
+    with open(source, 'rb+') as file:
+        if file.seek(0, os.SEEK_END):
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) not in (b'\n', b'\r'):  # the last line must be complete
+                file.write(os.linesep.encode())
+    rows.to_csv(source, mode='a', header=False, index=False)
+
+    table = pa.Table.from_pandas(fact, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[STORE_METADATA_KEY] = json.dumps(info).encode()
+    _write_arrow(table.replace_schema_metadata(metadata), entry['path'])
+
+    months = np.unique(new_dates.astype('datetime64[M]')) if dated else np.array([], dtype='datetime64[M]')
+    years = df['Order Year'].unique() if 'Order Year' in df.columns else []
+    entry = _version_entry(file_name)
+
+    path = cube_path(file_name)
+    if path in fresh:
+        positions = np.flatnonzero(load_version(file_name, ['Order Year'])['Order Year'].isin(years))
+        cells = build_cube(load_version(file_name, DIMENSION_COLUMNS + _TOTALS_INPUT_COLUMNS).take(positions))
+        cube = pd.read_parquet(path)
+        cube = apply_version_schema(pd.concat([cube[~cube['Order Year'].isin(years)], cells], ignore_index=True))
+        cube = cube.sort_values('Order Year', kind='stable', ignore_index=True)  # cells in order of first row
+        _write_parquet(cube, path)
+
+    path = partition_path(file_name)
+    if path in fresh and dated:
+        index = version_time_index(file_name)
+        codes = np.searchsorted(index['months'], months)
+        tables = [join_dimensions(entry['table'].slice(index['offsets'][code],
+                                                       index['offsets'][code + 1] - index['offsets'][code]),
+                                  entry['dimensions'], entry['columns']) for code in codes]
+        data = pa.concat_tables(tables, promote_options='permissive')
+        partitioning = ds.partitioning(pa.schema([(col, data.schema.field(col).type) for col in PARTITION_COLUMNS]),
+                                       flavor='hive')
+        ds.write_dataset(data, path, format='parquet', partitioning=partitioning,
+                         existing_data_behavior='delete_matching', max_rows_per_group=PARTITION_ROW_GROUP_SIZE)
+        os.utime(path)
+
+    return [str(month) for month in months]
+
+
+# Scenario sweep
+
+def _profit_arrays(list_price, discount, cogs, quantity):
+    """
+    Array version of `profit_calc`: derives and rounds the price columns from List Price, Discount and COGS.
+    Returns List Price, Net Price, Sales, COGS, Profit and Gross Margin.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        net_price = list_price * (1 - discount)
+        sales = net_price * quantity
+        profit = (net_price - cogs) * quantity
+        gross_margin = profit / sales
+    return [round_cents(values) for values in (list_price, net_price, sales, cogs, profit, gross_margin)]
+
+
+def _gross_margin_arrays(gross_margin, discount, cogs, quantity):
+    """
+    Array version of `gross_margin_calc`: derives and rounds the price columns from Gross Margin, Discount and
+    COGS. Returns List Price, Net Price, Sales, COGS, Profit and Gross Margin.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        net_price = cogs / (1 - gross_margin)
+        sales = net_price * quantity
+        list_price = net_price / (1 - discount)
+        profit = (net_price - cogs) * quantity
+        gross_margin = profit / sales
+    return [round_cents(values) for values in (list_price, net_price, sales, cogs, profit, gross_margin)]
+
+
+SIMULATION_COLUMNS = ['List Price', 'Net Price', 'Sales', 'COGS', 'Profit', 'Gross Margin']
+SIMULATION_LEVERS = ['List Price', 'Discount', 'COGS', 'Gross Margin']
+
+
+def _apply_lever(lever, method, value, list_price, discount, cogs, gross_margin):
+    """
+    Applies one lever of a simulation spec to the arrays of the selected rows, like the lever blocks of the app.
+    """
+    method = method.strip()  # the app adds trailing spaces to tell apart widget labels
+
+    if lever == 'List Price':
+        list_price = list_price * (1 + value / 100) if method == 'Increase in %' else np.full_like(list_price, value)
+    elif lever == 'Discount':
+        cap = value / 100
+        discount = np.where(discount < cap, discount, cap) if method == 'Max Treshold %' else np.full_like(discount, cap)
+    elif lever == 'COGS':
+        cogs = cogs * (1 + value / 100) if method == 'Increase in %' else np.full_like(cogs, value)
+    elif lever == 'Gross Margin':
+        target = value / 100
+        if method == 'Min Treshold %':
+            gross_margin = np.where(gross_margin >= target, gross_margin, target)
+        else:
+            gross_margin = np.full_like(gross_margin, target)
+    return list_price, discount, cogs, gross_margin
+
+
+@profiled()
+def run_simulation(df, spec):
+    """
+    Description: Runs a simulation on the selected rows, without Streamlit. The levers are given as a declarative
+    spec, e.g. `{'List Price': ('Increase in %', 10), 'Discount': ('Max Treshold %', 20)}`, and applied in the
+    order of the app (List Price, Discount, COGS, Gross Margin). The results are identical to running the lever
+    blocks of the app one after the other with `profit_calc` / `gross_margin_calc`, but the derived columns
+    (Net Price, Sales, Profit, Gross Margin) are computed and rounded only once, at the end. In between, only the
+    lever inputs that the next block reads again are rounded.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The selected data.
+    - `spec` (dict): For each lever in `SIMULATION_LEVERS`, a `(method, value)` pair with the method names and
+    values of the app ('Increase in %' / 'Target Value' for List Price and COGS, 'Target %' / 'Max Treshold %'
+    for Discount, 'Target %' / 'Min Treshold %' for Gross Margin). Other keys are ignored, so the parameters
+    saved with a simulation can be passed as they are.
+
+    Return:
+    - `simulation` (pandas.DataFrame): A copy of `df` with the simulated columns.
+    """
+    simulation = df.copy()
+    levers = [lever for lever in SIMULATION_LEVERS if spec.get(lever)]
+    if not levers:
+        return simulation
+
+    quantity = df['Quantity'].to_numpy(dtype='float64')
+    list_price = df['List Price'].to_numpy(dtype='float64')
+    discount = df['Discount'].to_numpy(dtype='float64')
+    cogs = df['COGS'].to_numpy(dtype='float64')
+    gross_margin = df['Gross Margin'].to_numpy(dtype='float64')
+
+    for i, lever in enumerate(levers):
+        method, value = spec[lever]
+        list_price, discount, cogs, gross_margin = _apply_lever(lever, method, value,
+                                                                list_price, discount, cogs, gross_margin)
+        if i == len(levers) - 1:
+            break
+
+        # Intermediate blocks: the app rounds every price column after each block. Only List Price and COGS
+        # (and Gross Margin, if the Gross Margin lever comes next) are read again by the next block.
+        if levers[i + 1] == 'Gross Margin':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                net_price = list_price * (1 - discount)
+                gross_margin = round_cents((net_price - cogs) * quantity / (net_price * quantity))
+        list_price, cogs = round_cents(list_price), round_cents(cogs)
+
+    # Last block: one fused derivation and rounding pass
+    if levers[-1] == 'Gross Margin':
+        results = _gross_margin_arrays(gross_margin, discount, cogs, quantity)
+    else:
+        results = _profit_arrays(list_price, discount, cogs, quantity)
+
+    simulation['Discount'] = discount
+    simulation[SIMULATION_COLUMNS] = np.column_stack(results)
+    return simulation
+
+
+def scenario_sweep(df, list_price_pct=None, discount_cap=None, cogs_pct=None, gm_min=None, max_cells=4000000):
+    """
+    Description: Evaluates a grid of simulation scenarios over a selection without Streamlit. Every combination
+    of the given lever values is simulated with the same formulas, rounding and order as the levers of the app
+    (List Price 'Increase in %', Discount 'Max Treshold %', COGS 'Increase in %', Gross Margin 'Min Treshold %'),
+    all scenarios at once with NumPy broadcasting. Rows are processed in blocks of at most `max_cells`
+    scenario x row values to bound memory.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The selected data (e.g. `selected_data` in the app).
+    - `list_price_pct` (list, optional): List Price changes in % (e.g. `range(-10, 11)`).
+    - `discount_cap` (list, optional): Maximum discounts in % (0 to 100).
+    - `cogs_pct` (list, optional): COGS changes in %.
+    - `gm_min` (list, optional): Minimum gross margins in % (0 to 100).
+    - `max_cells` (int): The maximum number of scenario x row values computed at once. Default is 4,000,000.
+    Levers that are not given are not applied, as when no method is selected in the app.
+
+    Return:
+    - `sweep` (pandas.DataFrame): One row per scenario, with the lever values and the rounded 'Quantity',
+    'Sales', 'Total COGS', 'Profit' and 'GM %' of the selection.
+    """
+    levers = {'List Price %': list_price_pct, 'Discount cap %': discount_cap,
+              'COGS %': cogs_pct, 'GM min %': gm_min}
+    levers = {name: np.asarray(values, dtype='float64') for name, values in levers.items() if values is not None}
+
+    # One column per scenario, one entry per lever
+    grid = np.meshgrid(*levers.values(), indexing='ij')
+    scenarios = {name: values.reshape(-1, 1) for name, values in zip(levers, grid)}
+    n_scenarios = len(next(iter(scenarios.values()))) if scenarios else 1
+
+    totals = np.zeros((4, n_scenarios))
+    block = max(1, max_cells // n_scenarios)
+
+    for start in range(0, len(df), block):
+        rows = df.iloc[start:start + block]
+        list_price = rows['List Price'].to_numpy(dtype='float64')[np.newaxis, :]
+        discount = rows['Discount'].to_numpy(dtype='float64')[np.newaxis, :]
+        cogs = rows['COGS'].to_numpy(dtype='float64')[np.newaxis, :]
+        gross_margin = rows['Gross Margin'].to_numpy(dtype='float64')[np.newaxis, :]
+        quantity = rows['Quantity'].to_numpy(dtype='float64')[np.newaxis, :]
+        sales = rows['Sales'].to_numpy(dtype='float64')[np.newaxis, :]
+        profit = rows['Profit'].to_numpy(dtype='float64')[np.newaxis, :]
+
+        if 'List Price %' in scenarios:
+            list_price = list_price * (1 + scenarios['List Price %'] / 100)
+            list_price, _, sales, cogs, profit, gross_margin = _profit_arrays(list_price, discount, cogs, quantity)
+
+        if 'Discount cap %' in scenarios:
+            cap = scenarios['Discount cap %'] / 100
+            discount = np.where(discount < cap, discount, cap)
+            list_price, _, sales, cogs, profit, gross_margin = _profit_arrays(list_price, discount, cogs, quantity)
+
+        if 'COGS %' in scenarios:
+            cogs = cogs * (1 + scenarios['COGS %'] / 100)
+            list_price, _, sales, cogs, profit, gross_margin = _profit_arrays(list_price, discount, cogs, quantity)
+
+        if 'GM min %' in scenarios:
+            threshold = scenarios['GM min %'] / 100
+            gross_margin = np.where(gross_margin >= threshold, gross_margin, threshold)
+            list_price, _, sales, cogs, profit, gross_margin = _gross_margin_arrays(gross_margin, discount, cogs,
+                                                                                    quantity)
+
+        shape = (n_scenarios, len(rows))
+        totals += [np.broadcast_to(quantity, shape).sum(axis=1),
+                   np.broadcast_to(sales, shape).sum(axis=1),
+                   np.broadcast_to(cogs * quantity, shape).sum(axis=1),
+                   np.broadcast_to(profit, shape).sum(axis=1)]
+
+    sweep = pd.DataFrame({name: values.ravel() for name, values in scenarios.items()})
+    sweep['Quantity'], sweep['Sales'], sweep['Total COGS'], sweep['Profit'] = totals
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sweep['GM %'] = sweep['Profit'] / sweep['Sales']
+    return round_columns(sweep, ['Quantity', 'Sales', 'Total COGS', 'Profit', 'GM %'])
+
+
+# Goal seek
+
+GOAL_LEVERS = {'List Price %': ('list_price_pct', -100.0, 100.0),
+               'Discount cap %': ('discount_cap', 0.0, 100.0),
+               'COGS %': ('cogs_pct', -100.0, 100.0)}
+GOAL_METRICS = ['Profit', 'GM %']
+GOAL_GRID = 16  # lever values evaluated at once per bisection step
+
+
+def _goal_results(df, lever, cents, metric):
+    """
+    Evaluates lever values given in hundredths with `scenario_sweep` (same formulas and ceil-to-cents rounding
+    as the app). Returns the sweep and the value of the metric for each lever value (GM % from the summed
+    Profit and Sales, before the ratio is rounded).
+    """
+    sweep = scenario_sweep(df, **{GOAL_LEVERS[lever][0]: np.asarray(cents) / 100})
+    if metric == 'Profit':
+        return sweep, sweep['Profit'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sweep, (sweep['Profit'] / sweep['Sales']).to_numpy()
+
+
+def _goal_estimate(df, lever, metric, target):
+    """
+    Closed-form lever value (in %) that reaches the target before rounding, or None. With a single List Price or
+    COGS change, total Profit is linear in the lever: Profit = A * (1 + x) - C for List Price and
+    A - C * (1 + y) for COGS, with A = sum(List Price * (1 - Discount) * Quantity) and C = sum(COGS * Quantity);
+    GM % = 1 - C / A (with the changed side scaled the same way).
+    """
+    quantity = df['Quantity'].to_numpy(dtype='float64')
+    a = (df['List Price'].to_numpy(dtype='float64') * (1 - df['Discount'].to_numpy(dtype='float64')) * quantity).sum()
+    c = (df['COGS'].to_numpy(dtype='float64') * quantity).sum()
+    if a == 0 or c == 0 or (metric == 'GM %' and target == 1):
+        return None
+
+    if lever == 'List Price %':
+        factor = (target + c) / a if metric == 'Profit' else c / (a * (1 - target))
+    elif lever == 'COGS %':
+        factor = (a - target) / c if metric == 'Profit' else a * (1 - target) / c
+    else:
+        return None
+    return (factor - 1) * 100
+
+
+@profiled()
+def goal_seek(df, lever, metric, target):
+    """
+    Description: Finds the value of a lever that brings the selection to a target total Profit or GM %, without
+    trying values one at a time. For List Price % and COGS % the value is first solved in closed form (Profit is
+    linear in these levers before rounding); the ceil-to-cents rounding of the rows is then handled by a
+    vectorized bisection, which evaluates `GOAL_GRID` lever values at once with `scenario_sweep` and narrows the
+    interval around the target. Discount caps are solved by the bisection alone. The lever values are searched
+    with the precision of the app inputs (0.01).
+
+    Parameters:
+    - `df` (pandas.DataFrame): The selected data, with the columns of `scenario_sweep`.
+    - `lever` (str): The lever to solve for: 'List Price %' ('Increase in %'), 'Discount cap %' ('Max Treshold %')
+    or 'COGS %' ('Increase in %').
+    - `metric` (str): 'Profit' or 'GM %' (as in the summary table, e.g. 0.2 for 20%).
+    - `target` (float): The target value of the metric.
+
+    Return:
+    - `solution` (pandas.DataFrame): One row with the lever value and the resulting 'Quantity', 'Sales',
+    'Total COGS', 'Profit' and 'GM %' (see `scenario_sweep`), for the lever value whose result is closest to
+    the target.
+    """
+    if lever not in GOAL_LEVERS or metric not in GOAL_METRICS:
+        raise ValueError(f'Unknown lever or metric: {lever!r}, {metric!r}')
+    if df.empty:
+        raise ValueError('The selection is empty')
+
+    _, low, high = GOAL_LEVERS[lever]
+    low, high = int(round(low * 100)), int(round(high * 100))
+
+    # Bounds and closed-form estimate (with neighbours at growing distances) evaluated at once
+    candidates = [low, high]
+    estimate = _goal_estimate(df, lever, metric, target)
+    if estimate is not None and np.isfinite(estimate):
+        center = int(round(estimate * 100))
+        candidates += [center + sign * step for step in (0, 1, 10, 100, 1000) for sign in (-1, 1)]
+    cents = np.unique(np.clip(candidates, low, high))
+    _, values = _goal_results(df, lever, cents, metric)
+
+    # Search on an increasing function: Profit and GM % grow with List Price and fall with COGS and Discount
+    sign = 1 if lever == 'List Price %' else -1
+    values, goal = sign * values, sign * target
+    if not values[0] <= goal <= values[-1]:
+        raise ValueError(f'{metric} {target} cannot be reached with {lever} between '
+                         f'{GOAL_LEVERS[lever][1]} and {GOAL_LEVERS[lever][2]}')
+
+    # Smallest bracket [lo, hi] with value(lo) < goal <= value(hi), then bisection on a grid of lever values
+    above = np.flatnonzero(values >= goal)[0]
+    lo, hi = (cents[above - 1], cents[above]) if above > 0 else (cents[0], cents[0])
+    while hi - lo > 1:
+        grid = np.unique(np.linspace(lo, hi, GOAL_GRID + 2).round().astype('int64'))[1:-1]
+        _, grid_values = _goal_results(df, lever, grid, metric)
+        grid_above = np.flatnonzero(sign * grid_values >= goal)
+        if len(grid_above):
+            hi = grid[grid_above[0]]
+            lo = grid[grid_above[0] - 1] if grid_above[0] > 0 else lo
+        else:
+            lo = grid[-1]
+
+    sweep, values = _goal_results(df, lever, np.array([lo, hi]), metric)
+    best = int(np.argmin(np.abs(values - target)))
+    return sweep.iloc[[best]].reset_index(drop=True)
+
+
+def version_row_index(file_name):
+    """
+    Description: Returns the 'Row ID' index of a version, built once and kept with the cached version. The
+    position of each 'Row ID' in the index is its row position in the data returned by `load_version`.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+
+    Return:
+    - `row_index` (pandas.Index): The 'Row ID' values in row order.
+    """
+    entry = _version_entry(file_name)
+    with _version_lock:
+        if entry.get('row_index') is None:
+            entry['row_index'] = pd.Index(load_version(file_name, ['Row ID'])['Row ID'])
+    return entry['row_index']
+
+    
+def insert_changes(original_df, updated_rows_df, row_index=None):
+    """
+    Description: Builds the full data of a simulation by writing the updated rows into the original data. Rows
+    are matched on 'Row ID' and written by position in a single scatter per column; missing values in the
+    updated rows keep the original value. Only the updated columns are copied, the other columns are shared
+    with `original_df`.
+
+    Parameters:
+    - `original_df` (pandas.DataFrame): The full data of the version.
+    - `updated_rows_df` (pandas.DataFrame): The updated rows, with a 'Row ID' column.
+    - `row_index` (pandas.Index, optional): The 'Row ID' values of `original_df` in row order, e.g. from
+    `version_row_index`. Built from `original_df` if not given.
+
+    Return:
+    - `new_df` (pandas.DataFrame): The full data with the updated rows.
+    """
+    if row_index is None:
+        row_index = pd.Index(original_df['Row ID'])
+
+    new_df = original_df.copy(deep=False)
+    positions = row_index.get_indexer(updated_rows_df['Row ID'])
+
+    for col in updated_rows_df.columns:
+        if col == 'Row ID' or col not in new_df.columns:
+            continue
+        values = updated_rows_df[col]
+        keep = values.notna().to_numpy() & (positions >= 0)
+        column = new_df[col].copy()
+        column.iloc[positions[keep]] = values.to_numpy()[keep]
+        new_df[col] = column
+
+    return new_df
+
+
+# Simulation overlays
+
+SIMULATION_INPUT_COLUMNS = ['Quantity', 'List Price', 'Discount', 'COGS', 'Gross Margin']
+
+
+@profiled()
+def simulation_overlay(file_name, positions, spec):
+    """
+    Description: Runs a simulation (see `run_simulation`) on the selected rows of a version and keeps only the
+    simulated columns of those rows. The overlay is all a session holds: reads of the simulated data go through
+    the overlay and then the shared version (see `read_overlay`), so no copy of the version is made.
+
+    Parameters:
+    - `file_name` (str): The name of the version as listed in the Version selector.
+    - `positions` (numpy.ndarray): The row positions of the selection (e.g. from `dimension_positions`).
+    - `spec` (dict): The simulation spec, as for `run_simulation`.
+
+    Return:
+    - `overlay` (dict): `'version'`, `'positions'` and `'columns'` (the simulated values of each changed column,
+    in the order of `positions`; empty if no lever is applied).
+    """
+    positions = np.asarray(positions)
+    selected = load_version(file_name, SIMULATION_INPUT_COLUMNS).take(positions)
+
+    columns = {}
+    if any(spec.get(lever) for lever in SIMULATION_LEVERS):
+        simulation = run_simulation(selected, spec)
+        columns = {col: simulation[col].to_numpy() for col in ['Discount'] + SIMULATION_COLUMNS}
+
+    return {'version': file_name, 'positions': positions, 'columns': columns}
+
+
+def read_overlay(overlay, columns=None, full=False):
+    """
+    Description: Reads the simulated data of an overlay: simulated columns come from the overlay, the other
+    columns from the shared version.
+
+    Parameters:
+    - `overlay` (dict): The overlay, from `simulation_overlay`.
+    - `columns` (list, optional): The columns to read. All columns of the version if not given.
+    - `full` (bool): Read all rows of the version, with the simulated values at the selected positions, instead
+    of the selected rows only. Only the simulated columns are copied. Default is False.
+
+    Return:
+    - `df` (pandas.DataFrame): The simulated data.
+    """
+    df = load_version(overlay['version'], columns)
+    positions = overlay['positions']
+    if not full:
+        df = df.take(positions)
+
+    for col, values in overlay['columns'].items():
+        if col not in df.columns:
+            continue
+        if full:
+            column = df[col].copy()
+            column.iloc[positions] = values
+            df[col] = column
+        else:
+            df[col] = values
+    return df
+
+
+@profiled()
+def overlay_change(overlay):
+    """
+    Description: Computes the change of the additive measures made by a simulation overlay (see
+    `totals_change`), reading only the selected rows of the columns the measures need.
+
+    Parameters:
+    - `overlay` (dict): The overlay, from `simulation_overlay`.
+
+    Return:
+    - `change` (pandas.Series): The change of each measure in `SUMMARY_MEASURES`.
+    """
+    before = load_version(overlay['version'], _TOTALS_INPUT_COLUMNS).take(overlay['positions'])
+    return totals_change(before, read_overlay(overlay, _TOTALS_INPUT_COLUMNS))
+
+
+@profiled()
+def overlay_totals(overlay, version_str='Simulation'):
+    """
+    Description: Sums the additive measures of the simulated rows of an overlay (see `summary_totals`), like the
+    Selection table did on the simulated data frame. Adding `overlay_change` to rolled-up baseline totals gives
+    the same measures up to float rounding, which ceiling to cents can turn into 0.01.
+
+    Parameters:
+    - `overlay` (dict): The overlay, from `simulation_overlay`.
+    - `version_str` (str): The name of the version, used as index of the result. Default is 'Simulation'.
+
+    Return:
+    - `df_grouped` (pandas.DataFrame): One row with the additive measures (no row if nothing is selected).
+    """
+    return summary_totals(read_overlay(overlay, _TOTALS_INPUT_COLUMNS), version_str, 'All')
+
+
+@profiled()
+def overlay_summary(overlay, group_by, version_strs=('Baseline', 'Simulation')):
+    """
+    Description: Breaks the summary table of the selection down by dimension columns, for the baseline and the
+    simulation of an overlay, in a single grouped aggregation (see `grouped_totals`).
 
     Parameters:
-    - `df` (pandas.DataFrame): The DataFrame from which the function will extract unique values.
-    - `col_name` (str): The name of the column in the DataFrame from which unique values are to be retrieved.
+    - `overlay` (dict): The overlay, from `simulation_overlay`.
+    - `group_by` (list): The columns to break the summary down by (e.g. `['Region', 'Category']`).
+    - `version_strs` (tuple): The names of the baseline and simulation rows. Default is ('Baseline', 'Simulation').
 
     Return:
-    - `choices_lst` (list): A list of unique values from the specified column, sorted in ascending order, with
-    `'All'` as the first item.
+    - `summary` (pandas.DataFrame): The summary table per version and group (see `summary_metrics`).
     """
-    choices_lst = list(df[col_name].unique())  # Convert unique values to a list
-    choices_lst.sort()  # Sort the list in ascending order
-    choices_lst.insert(0, 'All')  # Insert 'All' at the beginning of the list
-    return choices_lst
+    columns = list(dict.fromkeys(_TOTALS_INPUT_COLUMNS + list(group_by)))
+    before = load_version(overlay['version'], columns).take(overlay['positions'])
+    after = read_overlay(overlay, columns)
+    return summary_metrics(grouped_totals([(version_strs[0], before), (version_strs[1], after)], group_by))
 
 
-def select_name(df, level):
+# Version comparison
+
+DIFF_MEASURES = ['Sales', 'Total COGS', 'Profit']
+_DIFF_INPUT_COLUMNS = ['Row ID', 'Quantity', 'Sales', 'COGS', 'Profit']
+
+
+def version_alignment(base, other):
     """
-    Description: Returns a list of selectable options for a given level, using the `fill_selector` function to
-    generate the list of options.
+    Description: Returns the positional join of two versions on 'Row ID': the position in `base` of each row of
+    `other`. It is computed once and kept with the cached `other` version. The 'Row ID' values of each version
+    must be unique.
 
     Parameters:
-    - `df` (pandas.DataFrame): The DataFrame from which the function will extract unique values for the selected
-    level.
-    - `level` (str): The level of selection (e.g., 'All', 'Category', 'Product ID').
+    - `base` (str): The name of the reference version.
+    - `other` (str): The name of the compared version.
 
     Return:
-    - `selection_options` (list): A list of selectable options for the user interface, either a placeholder
-    `['--']` if 'All' is selected, or a sorted list of unique values from the specified level.
+    - `positions` (numpy.ndarray): For each row of `other`, its row position in `base` (-1 if not in `base`).
     """
-    if level == 'All':
-        return ['--']  # Return a placeholder for 'All'
+    entry = _version_entry(other)
+    base_entry = _version_entry(base)
+    key = (base_entry['source'], base_entry['mtime'])
+
+    with _version_lock:
+        alignments = entry.setdefault('alignments', {})
+        if key not in alignments:
+            for file_name in (base, other):
+                row_index = version_row_index(file_name)
+                if not row_index.is_unique:
+                    duplicates = row_index[row_index.duplicated()].unique()
+                    raise ValueError(f"Row IDs used more than once in '{file_name}', the versions cannot be "
+                                     f"compared row by row: {sorted(duplicates.tolist())[:10]}")
+            alignments[key] = version_row_index(base).get_indexer(version_row_index(other))
+    return alignments[key]
+
+
+def _diff_measures(df):
+    """
+    Returns the row values of `DIFF_MEASURES` as a float array with one column per measure.
+    """
+    quantity = df['Quantity'].to_numpy(dtype='float64')
+    return np.column_stack([df['Sales'].to_numpy(dtype='float64'),
+                            df['COGS'].to_numpy(dtype='float64') * quantity,
+                            df['Profit'].to_numpy(dtype='float64')])
+
+
+def _version_changes(base, other, base_measures, positions=None):
+    """
+    Computes the rows of `other` that differ from `base`, as row positions in `base` and measure deltas. Rows
+    of a delta snapshot of `base` are only compared where the snapshot changed them. Rows that are only in
+    `other` (added) are returned separately; rows that are only in `base` (removed) count with their negated
+    measures.
+    """
+    alignment = version_alignment(base, other)
+    other_df = load_version(other, _DIFF_INPUT_COLUMNS)
+
+    entry = _version_entry(other)
+    if entry['parent'] == base:
+        candidates = version_row_index(other).get_indexer(entry['delta']['Row ID'])
+        candidates = candidates[candidates >= 0]
     else:
-        selection_options = fill_selector(df, level)
-        return selection_options
-    
+        candidates = np.arange(len(other_df))
 
-def apply_filter(df, col_name, selector):
-    """    
-    Description: Filters a DataFrame based on a specified column and selector value. If the selector is 'All',
-    no filtering is applied; otherwise, the DataFrame is filtered to include only the rows where the column's value
-    matches the selector.
+    matched = candidates[alignment[candidates] >= 0]
+    base_rows = alignment[matched]
+    other_measures = _diff_measures(other_df.take(matched))
+    deltas = other_measures - base_measures[base_rows]
+    changed = (deltas != 0).any(axis=1)
+    base_rows, other_rows, deltas = base_rows[changed], matched[changed], deltas[changed]
+
+    added = np.flatnonzero(alignment < 0)
+    removed = np.setdiff1d(np.arange(len(base_measures)), alignment[alignment >= 0], assume_unique=False)
+    if positions is not None:
+        keep = np.isin(base_rows, positions)
+        base_rows, other_rows, deltas = base_rows[keep], other_rows[keep], deltas[keep]
+        removed = np.intersect1d(removed, positions)
+        added = added[:0]  # added rows have no position in `base` to filter on
+
+    return {'base_rows': base_rows, 'other_rows': other_rows, 'deltas': deltas,
+            'added': added, 'removed': removed, 'other_df': other_df}
+
+
+def _gm_delta(sales, profit, delta_sales, delta_profit):
+    """
+    Returns the change of Profit / Sales (GM %) when Sales and Profit change by the given deltas.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (profit + delta_profit) / (sales + delta_sales) - profit / sales
+
+
+def version_diff(base, other, level=None):
+    """
+    Description: Lists the rows of a version that differ from a reference version, aligned on 'Row ID' (see
+    `version_alignment`). Identical rows are skipped; for delta snapshots of `base`, only their stored rows are
+    compared.
 
     Parameters:
-    - `df` (pandas.DataFrame): The DataFrame to be filtered.
-    - `col_name` (str): The name of the column to apply the filter on.
-    - `selector` (str): The value to filter the column by. If 'All' is selected, no filtering is applied.
+    - `base` (str): The name of the reference version (e.g. 'Baseline.csv').
+    - `other` (str): The name of the compared version.
+    - `level` (str, optional): A dimension column added to the result (e.g. 'Region').
 
     Return:
-    - `data_selection` (pandas.DataFrame): The filtered DataFrame based on the selector value. If 'All' is selected,
-    the original DataFrame is returned unmodified.
+    - `diff` (pandas.DataFrame): One row per changed, added or removed row, with 'Row ID', 'Status', the level
+    column if given, and the deltas of 'Sales', 'Total COGS', 'Profit' and 'GM %' (row Profit / Sales).
     """
-    if selector != 'All':
-        data_selection = df[df[col_name] == selector]
-        return data_selection
+    base_df = load_version(base, _DIFF_INPUT_COLUMNS)
+    base_measures = _diff_measures(base_df)
+    changes = _version_changes(base, other, base_measures)
+    other_df = changes['other_df']
+
+    added_measures = _diff_measures(other_df.take(changes['added']))
+    removed_measures = base_measures[changes['removed']]
+    deltas = np.concatenate([changes['deltas'], added_measures, -removed_measures])
+    before = np.concatenate([base_measures[changes['base_rows']], np.zeros_like(added_measures), removed_measures])
+
+    diff = pd.DataFrame({
+        'Row ID': np.concatenate([other_df['Row ID'].to_numpy()[changes['other_rows']],
+                                  other_df['Row ID'].to_numpy()[changes['added']],
+                                  base_df['Row ID'].to_numpy()[changes['removed']]]),
+        'Status': np.repeat(['changed', 'added', 'removed'],
+                            [len(changes['base_rows']), len(changes['added']), len(changes['removed'])]),
+    })
+    if level is not None:
+        diff[level] = np.concatenate([load_version(base, [level])[level].to_numpy()[changes['base_rows']],
+                                      load_version(other, [level])[level].to_numpy()[changes['added']],
+                                      load_version(base, [level])[level].to_numpy()[changes['removed']]])
+    for i, measure in enumerate(DIFF_MEASURES):
+        diff[measure] = deltas[:, i]
+    diff['GM %'] = _gm_delta(before[:, 0], before[:, 2], deltas[:, 0], deltas[:, 2])
+    return diff
+
+
+def compare_versions(base, versions, level=None, positions=None):
+    """
+    Description: Compares versions to a reference version in one vectorized pass per version. The rows are
+    aligned on 'Row ID' with a precomputed positional join (see `version_alignment`); only the rows that differ
+    are read, and their deltas are added to the reference totals per group with `numpy.bincount` on integer
+    group codes. Nothing is merged and no version is copied.
+
+    Parameters:
+    - `base` (str): The name of the reference version (e.g. 'Baseline.csv').
+    - `versions` (list): The names of the compared versions.
+    - `level` (str, optional): A product or geography column to break the totals down by (e.g. 'Category',
+    'Region'). The totals of whole versions are compared if not given.
+    - `positions` (numpy.ndarray, optional): Row positions of `base` to compare (e.g. the selection, from
+    `dimension_positions`). Rows that are not in `base` are ignored when given.
+
+    Return:
+    - `comparison` (pandas.DataFrame): One row per version (and level value), indexed by 'Version' (and the
+    level), with 'Sales', 'Total COGS', 'Profit' and 'GM %' of the version and their change against `base`
+    ('Δ Sales', 'Δ Total COGS', 'Δ Profit', 'Δ GM %'). The first rows are those of `base`.
+    """
+    base_df = load_version(base, _DIFF_INPUT_COLUMNS)
+    base_measures = _diff_measures(base_df)
+
+    # Integer group codes of the base rows
+    if level is None:
+        labels = pd.Index(['All'])
+        codes = np.zeros(len(base_df), dtype='int64')
+    elif level in DIMENSION_COLUMNS:
+        dim = version_dimension_index(base)[level]
+        labels, codes = pd.Index(dim['values']), dim['codes'].astype('int64')
     else:
-        return df
-    
+        codes, labels = pd.factorize(load_version(base, [level])[level], sort=True)
+    if (codes < 0).any():
+        labels = labels.append(pd.Index([np.nan], dtype=labels.dtype))  # group of missing values
+        codes = np.where(codes < 0, len(labels) - 1, codes)
 
-def profit_calc(df, col_lst):
-    df['Net Price'] = df['List Price'] * (1 - df['Discount'])
-    df['Sales'] = df['Net Price'] * df['Quantity']
-    df['Profit'] = (df['Net Price'] - df['COGS']) * df['Quantity']
-    df['Gross Margin'] = df['Profit'] / df['Sales']
-    
-    # formatting
-    for col in col_lst:
-        
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-        df[col] = df[col].apply(
-                        lambda x: math.ceil(x * 100) / 100 if pd.notna(x) and np.isfinite(x) else x)
-        #df[col] = df[col].astype('float64')
+    weights = np.ones(len(base_df)) if positions is None else np.bincount(positions, minlength=len(base_df))
 
-    return df
+    def group_sums(group_codes, values, n_groups):
+        return np.column_stack([np.bincount(group_codes, values[:, i], minlength=n_groups)
+                                for i in range(len(DIFF_MEASURES))])
 
+    base_totals = group_sums(codes, base_measures * weights[:, np.newaxis], len(labels))
+    base_rows = np.bincount(codes, weights, minlength=len(labels))
 
-def gross_margin_calc(df, col_lst):
-    df['Net Price'] = df['COGS'] / (1 - df['Gross Margin'])
-    df['Sales'] = df['Net Price'] * df['Quantity']
-    df['List Price'] = df['Net Price'] / (1 - df['Discount'])
-    df['Profit'] = (df['Net Price'] - df['COGS']) * df['Quantity']
-    df['Gross Margin'] = df['Profit'] / df['Sales']
-    
-    # formatting
-    for col in col_lst:
-        
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-        df[col] = df[col].apply(
-                        lambda x: math.ceil(x * 100) / 100 if pd.notna(x) and np.isfinite(x) else x)
-        #df[col] = df[col].astype('float64')
+    results = []
+    for version in versions:
+        changes = _version_changes(base, version, base_measures, positions)
+        added_codes = np.zeros(len(changes['added']), dtype='int64')
+        version_labels = labels
+        if len(changes['added']) and level is not None:
+            added_values = load_version(version, [level])[level].to_numpy()[changes['added']]
+            version_labels = labels.append(pd.Index(added_values).difference(labels))
+            added_codes = version_labels.get_indexer(added_values)
 
-    return df
+        n_groups = len(version_labels)
+        change = (group_sums(codes[changes['base_rows']], changes['deltas'], n_groups)
+                  + group_sums(added_codes, _diff_measures(changes['other_df'].take(changes['added'])), n_groups)
+                  - group_sums(codes[changes['removed']], base_measures[changes['removed']], n_groups))
+        results.append((version, version_labels, change))
+
+    # One block of rows per version, over the groups of the base and the groups added by the versions
+    all_labels = labels.append([extra[len(labels):] for _, extra, _ in results]).unique()
+    before = np.zeros((len(all_labels), len(DIFF_MEASURES)))
+    before[:len(labels)] = base_totals
+    in_scope = np.ones(len(all_labels), dtype=bool)  # groups with rows in the compared scope
+    in_scope[:len(labels)] = base_rows > 0
+
+    blocks = [(base, np.zeros_like(before))]
+    for version, version_labels, change in results:
+        aligned = np.zeros_like(before)
+        aligned[all_labels.get_indexer(version_labels)] = change
+        blocks.append((version, aligned))
+
+    frames = []
+    for version, change in blocks:
+        after = before + change
+        frame = pd.DataFrame(after, columns=DIFF_MEASURES)
+        frame['GM %'] = np.divide(after[:, 2], after[:, 0], out=np.full(len(after), np.nan), where=after[:, 0] != 0)
+        for i, measure in enumerate(DIFF_MEASURES):
+            frame['Δ ' + measure] = change[:, i]
+        frame['Δ GM %'] = frame['GM %'] - np.divide(before[:, 2], before[:, 0], out=np.full(len(before), np.nan),
+                                                    where=before[:, 0] != 0)
+        frame.insert(0, 'Version', version)
+        if level is not None:
+            frame.insert(1, level, all_labels)
+        frames.append(frame[in_scope])
 
+    comparison = pd.concat(frames, ignore_index=True)
+    comparison = comparison.set_index(['Version'] if level is None else ['Version', level])
+    return round_columns(comparison, comparison.columns)
 
-def summary_tab(df, version_str, selected_year):
+
+# Comparison charts
+
+CHART_MEASURES = ['Sales', 'Total COGS', 'Profit']
+CHART_CACHE_SIZE = 64
+
+_chart_layouts = {}
+_chart_figures = {}
+
+
+def _chart_layout(versions):
     """
-    This function takes a DataFrame 'df' containing financial data and performs various calculations
-    such as adjusting the 'List Price', calculating 'Discount Value', 'Net Price', 'COGS', 'Gross Margin',
-    and performing group-by operations. It returns a DataFrame with the aggregated results and rounded values.
+    Builds the empty comparison figure of a list of versions: one subplot per measure in `CHART_MEASURES`, one
+    bar trace per version (colored like `px.bar` with `color='Version'`), centered titles, no axis titles and
+    no legend.
     """
-    # Step 1: Filter by 'Order Year'
+    colors = px.colors.qualitative.Plotly
+    fig = make_subplots(rows=1, cols=len(CHART_MEASURES), subplot_titles=CHART_MEASURES)
+    for i, measure in enumerate(CHART_MEASURES):
+        for j, version in enumerate(versions):
+            fig.add_trace(go.Bar(x=[version], y=[0], name=str(version), marker_color=colors[j % len(colors)],
+                                 showlegend=False, hovertemplate=f'Version=%{{x}}<br>{measure}=%{{y}}<extra></extra>'),
+                          row=1, col=i + 1)
+    fig.update_layout(height=300, margin={'t': 40})
+    return fig
 
-    if selected_year != 'All':
-        df = df[df['Order Year'] == selected_year]
-    else:
-        pass
-    
-    # Step 2: Add the 'Title' column
-    df['Version'] = version_str
-    
-    # Step 3: Calculate Discount and COGS Total value
-    df['Discount Value'] = df['Discount'] * df['List Price'] * df['Quantity']
-    df['Total COGS'] = df['COGS'] * df['Quantity']
-    
-    # Step 4: Group the data by 'Title' and aggregate the numeric columns
-    df_grouped = df.groupby(['Version'])[['Quantity', 'Sales', 'Discount Value', 'Total COGS', 'Profit']].sum()
-    
-    # Step 5: Calculate the rest of financial metrics
-    df_grouped['Net Price'] = df_grouped['Sales'] / df_grouped['Quantity']
-    df_grouped['COGS'] = (df_grouped['Sales'] - df_grouped['Profit']) / df_grouped['Quantity']
-    df_grouped['List Price'] = (df_grouped['Sales'] + df_grouped['Discount Value']) / df_grouped['Quantity']
-    df_grouped['Disc. %'] = np.where(df_grouped['List Price'] != 0, 
-                                 1 - (df_grouped['Net Price'] / df_grouped['List Price']), 
-                                 0)
-    df_grouped['GM %'] = df_grouped['Profit'] / df_grouped['Sales']
-        
-    # Step 6: Reorder the columns
-    new_column_order = ['COGS', 'List Price', 'Net Price', 'Disc. %', 'Quantity', 'Sales', 'Total COGS', 'Profit', 'GM %']
-    df_grouped = df_grouped[new_column_order]
-    
-    # Step 7: Round the values in the DataFrame
-    for col in df_grouped.columns:
-        df_grouped[col] = pd.to_numeric(df_grouped[col], errors='coerce')
-        df_grouped[col] = df_grouped[col].apply(
-            lambda x: math.ceil(x * 100) / 100 if pd.notna(x) and np.isfinite(x) else x)
-        #df_grouped[col] = df_grouped[col].astype('float64')
-    
-    return df_grouped
 
+def comparison_figure(df):
+    """
+    Description: Builds the comparison figure of a summary table: one figure with a bar subplot for each of
+    'Sales', 'Total COGS' and 'Profit'. Figures are memoized on a hash of the table content, and the layout of
+    a set of versions is built once: a new table only updates the bar values of a copy of it.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The summary table, indexed by 'Version', with the columns in `CHART_MEASURES`.
+
+    Return:
+    - `fig` (plotly.graph_objects.Figure): The figure. It is shared by the callers, do not modify it.
+    """
+    table = df[CHART_MEASURES]
+    key = hashlib.sha1(pd.util.hash_pandas_object(table.reset_index(), index=False).to_numpy().tobytes()
+                       + repr(list(table.columns)).encode()).hexdigest()
 
+    fig = _chart_figures.get(key)
+    if fig is None:
+        versions = tuple(table.index)
+        layout = _chart_layouts.get(versions)
+        if layout is None:
+            layout = _chart_layouts[versions] = _chart_layout(versions)
 
+        fig = go.Figure(layout)
+        values = table.to_numpy()
+        for i in range(len(CHART_MEASURES)):
+            for j in range(len(versions)):
+                fig.data[i * len(versions) + j].y = [values[j, i]]
 
-    
-def insert_changes(original_df, updated_rows_df):
-    new_df = original_df.copy()
-    new_df.set_index('Row ID', inplace=True)
-    updated_rows_df.set_index('Row ID', inplace=True)
-    new_df.update(updated_rows_df)
-    new_df.reset_index(inplace=True)
-    return new_df
+        if len(_chart_figures) >= CHART_CACHE_SIZE:
+            del _chart_figures[next(iter(_chart_figures))]  # oldest entry
+        _chart_figures[key] = fig
+    return fig
 
 
+@profiled()
 def comparison_bar_charts(df, df_name='df'):
     """
-    Function to generate and display three side-by-side bar charts for 'Sales', 'Total COGS', and 'Profit'.
-    The charts are created using Plotly Express and displayed in a Streamlit app. Each bar is colored based on the 'Version'.
+    Function to display the bar charts of 'Sales', 'Total COGS', and 'Profit' side by side, as one figure with
+    three subplots (see `comparison_figure`). Each bar is colored based on the 'Version'.
     The axis titles and legends are hidden, and the chart titles are centered.
 
     Parameters:
     df (pd.DataFrame): The DataFrame containing the data for the charts, including 'Version', 'Sales', 'Total COGS', and 'Profit'.
     df_name (str): A unique name or identifier for the DataFrame, used to create unique chart keys. Default is 'df'.
     """
-    # Reset index and add a 'Color' column based on the 'Version' column
-    df_reset = df.reset_index()
-    df_reset['Color'] = df_reset['Version']
-
-    # Create three columns in the Streamlit layout for displaying the charts
-    col1, col2, col3 = st.columns(3)
-
-    # First chart (Sales)
-    with col1:
-        fig_sales = px.bar(df_reset, 
-                           x='Version', 
-                           y='Sales', 
-                           color='Color', 
-                           height=300, 
-                           width=400)
-        fig_sales.update_layout(title={'text': 'Sales', 'x': 0.5, 'xanchor': 'center'},
-                                xaxis_title="",
-                                yaxis_title="",
-                                showlegend=False)
-        st.plotly_chart(fig_sales, key=f'{df_name}_sales_chart')
-
-    # Second chart (Total COGS)
-    with col2:
-        fig_cogs = px.bar(df_reset, 
-                          x='Version', 
-                          y='Total COGS', 
-                          color='Color', 
-                          height=300, 
-                          width=400)
-        fig_cogs.update_layout(title={'text': 'Total COGS', 'x': 0.5, 'xanchor': 'center'},
-                               xaxis_title="",
-                               yaxis_title="",
-                               showlegend=False)
-        st.plotly_chart(fig_cogs, key=f'{df_name}_cogs_chart')
-
-    # Third chart (Profit)
-    with col3:
-        fig_profit = px.bar(df_reset, 
-                            x='Version', 
-                            y='Profit', 
-                            color='Color', 
-                            height=300, 
-                            width=400)
-        fig_profit.update_layout(title={'text': 'Profit', 'x': 0.5, 'xanchor': 'center'},
-                                 xaxis_title="",
-                                 yaxis_title="",
-                                 showlegend=False)
-        st.plotly_chart(fig_profit, key=f'{df_name}_profit_chart')
+    # The figure is unchanged while the table is, so Streamlit resends the same message
+    st.plotly_chart(comparison_figure(df), key=f'{df_name}_comparison_chart')
 
 
 # Define the function to run when the "Save" button is clicked
@@ -236,25 +2550,98 @@ def save_simulation(df, file_name, file_list):
 '''
 
 # Function to save the simulation and track the file name
-def save_simulation(df, file_name):
+def simulation_delta(simulation, parent_df):
     """
-    This function saves the given DataFrame to a CSV file with the specified file name and timestamp.
-    
+    Description: Keeps only the rows and columns of a simulation that differ from its parent version. Missing
+    values in the simulation keep the parent value, like `insert_changes` does.
+
     Parameters:
-    df (pandas.DataFrame): The DataFrame to be saved.
-    file_name (str): The base name of the file to be saved.
+    - `simulation` (pandas.DataFrame): The simulated rows, with a 'Row ID' column.
+    - `parent_df` (pandas.DataFrame): The version the simulation was run on.
+
+    Return:
+    - `delta` (pandas.DataFrame): The 'Row ID' of the changed rows and the changed columns.
+    """
+    cols = [col for col in simulation.columns if col in parent_df.columns and col != 'Row ID']
+
+    base = parent_df.set_index('Row ID').loc[simulation['Row ID'], cols]
+    new = simulation.set_index('Row ID')[cols]
+    new = new.where(new.notna(), base)
+
+    changed = (new != base) & ~(new.isna() & base.isna())
+    delta = new.loc[changed.any(axis=1), changed.columns[changed.any(axis=0)]]
+    return delta.reset_index()
+
+
+SNAPSHOT_COMPRESSION = 'zstd'
+SAVE_STEPS = ['Queued', 'Computing changes', 'Writing file', 'Registering', 'Done']
+
+_save_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='save_simulation')
+
+
+def _write_simulation(df, full_name, parent, params, timestamp, progress):
+    """
+    Writes a simulation as a delta snapshot (see `save_simulation`) and registers it, reporting the current step
+    in `progress['step']` (an index of `SAVE_STEPS`). The file is written under a temporary name and renamed
+    once complete; the registry entry is only added after that.
+    """
+    path = os.path.join(DATA_DIR, full_name)
+
+    # Keep only the changes against the parent version
+    progress['step'] = 1
+    parent_cols = [col for col in df.columns if col in _version_entry(parent)['columns']]
+    delta = simulation_delta(df, load_version(parent, parent_cols))
+
+    # Save the changes, with the parent and parameters in the file metadata
+    progress['step'] = 2
+    info = {'parent': parent, 'params': params or {}, 'created': timestamp}
+    table = pa.Table.from_pandas(delta, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SNAPSHOT_METADATA_KEY] = json.dumps(info, default=str).encode()
+    try:
+        pq.write_table(table.replace_schema_metadata(metadata), path + '.tmp', compression=SNAPSHOT_COMPRESSION)
+        os.replace(path + '.tmp', path)
+    finally:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+
+    # Add the simulation to the registry, once the file is written
+    progress['step'] = 3
+    register_simulation(full_name, parent=parent, params=params, row_count=len(delta), created=timestamp,
+                        file_format='delta-parquet')
+
+    progress['step'] = 4
+    return full_name
+
+
+def _simulation_name(file_name):
+    """
+    Returns the timestamp and the full file name of a simulation saved now.
     """
     # Get the current timestamp in 'YYYY-MM-DD_HH-MM-SS' format
     timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-    
+
     # Generate the full name by appending timestamp
-    full_name = file_name + '_' + timestamp + '.csv'
-    
-    # Define the path where the file will be saved
-    path = './data/' + full_name
+    return timestamp, file_name + '_' + timestamp + DELTA_SUFFIX
+
+
+@profiled()
+def save_simulation(df, file_name, parent, params=None):
+    """
+    This function saves a simulation as a delta snapshot of its parent version, with the specified file name and
+    timestamp. Only the changed rows and columns are written (compressed Parquet), together with the name of the
+    parent version and the simulation parameters. `load_version` rebuilds the full data from the parent when
+    the snapshot is loaded. The file is written atomically and registered once complete. See
+    `save_simulation_async` to save without blocking the app.
     
-    # Save the DataFrame to CSV
-    df.to_csv(path, index=False)
+    Parameters:
+    df (pandas.DataFrame): The simulated rows (or the full simulated data) to be saved, with a 'Row ID' column.
+    file_name (str): The base name of the file to be saved.
+    parent (str): The name of the version the simulation was run on (e.g. 'Baseline.csv').
+    params (dict): The simulation parameters, stored in the snapshot for reference. Default is None.
+    """
+    timestamp, full_name = _simulation_name(file_name)
+    _write_simulation(df, full_name, parent, params, timestamp, {})
     
     # Inform the user the simulation was saved
     st.write(f"Simulation '{full_name}' saved successfully!")
@@ -262,6 +2649,78 @@ def save_simulation(df, file_name):
     return full_name
 
 
+@profiled()
+def save_simulation_async(df, file_name, parent, params=None):
+    """
+    Description: Saves a simulation like `save_simulation`, in a background thread, so the app stays
+    responsive while the file is written. Use `save_status` to follow the save.
+
+    Parameters:
+    - `df` (pandas.DataFrame): The simulated rows to be saved, with a 'Row ID' column. It must not be changed
+    while the save runs.
+    - `file_name` (str): The base name of the file to be saved.
+    - `parent` (str): The name of the version the simulation was run on (e.g. 'Baseline.csv').
+    - `params` (dict, optional): The simulation parameters.
+
+    Return:
+    - `job` (dict): `'name'` (the full file name), `'progress'` (updated by the background thread) and
+    `'future'`.
+    """
+    timestamp, full_name = _simulation_name(file_name)
+    progress = {'step': 0}
+    future = _save_executor.submit(_write_simulation, df, full_name, parent, params, timestamp, progress)
+    return {'name': full_name, 'progress': progress, 'future': future}
+
+
+def save_status(job):
+    """
+    Description: Reports the state of a background save (see `save_simulation_async`).
+
+    Parameters:
+    - `job` (dict): The save job.
+
+    Return:
+    - `status` (tuple): `(state, fraction, message)`, where `state` is 'running', 'done' or 'failed' and
+    `fraction` the share of the steps completed.
+    """
+    future, step = job['future'], job['progress']['step']
+    if not future.done():
+        return 'running', step / (len(SAVE_STEPS) - 1), f"Saving '{job['name']}': {SAVE_STEPS[step]}..."
+    if future.exception() is not None:
+        return 'failed', step / (len(SAVE_STEPS) - 1), f"Saving '{job['name']}' failed: {future.exception()}"
+    return 'done', 1.0, f"Simulation '{job['name']}' saved successfully!"
+
+
+def show_save_jobs(jobs):
+    """
+    Description: Displays the progress of the background saves of a session. Finished saves are shown once and
+    then removed from `jobs`.
+
+    Parameters:
+    - `jobs` (list): The save jobs of the session, from `save_simulation_async`.
+
+    Return:
+    - `finished` (bool): True if a save finished since the last call (the Version selector needs a rerun).
+    """
+    finished = False
+    for job in list(jobs):
+        state, fraction, message = save_status(job)
+        if state == 'running':
+            st.progress(fraction, text=message)
+            continue
+
+        if state == 'done':
+            st.success(message)
+        else:
+            st.error(message)
+        if job.get('shown'):
+            jobs.remove(job)
+        else:
+            job['shown'] = True
+            finished = True
+    return finished
+
+
 def save_list_to_csv(my_list, file_path):
     """
     This function saves a list of simulation names to a CSV file.
@@ -307,3 +2766,188 @@ def read_list_from_csv(file_path):
             simulation_list.append(row[0])  # row[0] holds the simulation name
     
     return simulation_list
+
+
+# Simulation registry
+
+SIMULATIONS_LIST_FILE = 'simulations_list.csv'
+REGISTRY_FILE = 'simulations.db'
+
+_registry_ready = set()
+_registry_listing = {}
+
+
+def registry_path():
+    """
+    Description: Returns the path of the simulation registry (SQLite database) of `DATA_DIR`.
+
+    Return:
+    - `path` (str): The path of the database file.
+    """
+    return os.path.abspath(os.path.join(DATA_DIR, REGISTRY_FILE))
+
+
+def _registry_connection():
+    """
+    Opens the simulation registry. On first use the table is created and the names of `simulations_list.csv`
+    are imported, in one transaction, so concurrent sessions import them only once.
+    """
+    path = registry_path()
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    if path in _registry_ready:
+        return connection
+
+    connection.execute('PRAGMA journal_mode=WAL')  # readers do not wait for writers
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        connection.execute("""CREATE TABLE IF NOT EXISTS simulations (
+                                  name TEXT PRIMARY KEY,
+                                  parent TEXT,
+                                  params TEXT,
+                                  row_count INTEGER,
+                                  created TEXT,
+                                  path TEXT NOT NULL,
+                                  format TEXT NOT NULL)""")
+        connection.execute('CREATE INDEX IF NOT EXISTS simulations_parent ON simulations (parent)')
+
+        # The user version counts the changes of the registry, 0 until the CSV list is imported
+        if connection.execute('PRAGMA user_version').fetchone()[0] == 0:
+            list_path = os.path.join(DATA_DIR, SIMULATIONS_LIST_FILE)
+            names = read_list_from_csv(list_path) if os.path.exists(list_path) else []
+            for name in names:
+                _insert_simulation(connection, _file_record(name))
+            connection.execute('PRAGMA user_version = 1')
+        connection.execute('COMMIT')
+    except Exception:
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+        connection.close()
+        raise
+
+    _registry_ready.add(path)
+    return connection
+
+
+def _file_record(name):
+    """
+    Describes an existing version file for the registry. Delta snapshots carry their parent, parameters and
+    creation time; for other files only the location and format are known.
+    """
+    path = os.path.join(DATA_DIR, name)
+    record = {'name': name, 'parent': None, 'params': None, 'row_count': None, 'created': None, 'path': path,
+              'format': 'delta-parquet' if name.endswith(DELTA_SUFFIX) else 'csv'}
+
+    if name.endswith(DELTA_SUFFIX) and os.path.exists(path):
+        info = read_snapshot_info(name)
+        record.update(parent=info['parent'], params=json.dumps(info['params'], default=str),
+                      row_count=pq.ParquetFile(path).metadata.num_rows, created=info['created'])
+    return record
+
+
+def _insert_simulation(connection, record):
+    """
+    Inserts or updates a registry record inside an open transaction. A name saved again keeps its position.
+    """
+    connection.execute("""INSERT INTO simulations (name, parent, params, row_count, created, path, format)
+                          VALUES (:name, :parent, :params, :row_count, :created, :path, :format)
+                          ON CONFLICT (name) DO UPDATE SET parent = excluded.parent, params = excluded.params,
+                              row_count = excluded.row_count, created = excluded.created, path = excluded.path,
+                              format = excluded.format""", record)
+
+
+def register_simulation(name, parent=None, params=None, row_count=None, created=None, file_format=None):
+    """
+    Description: Adds a saved version to the simulation registry, in a single atomic transaction. Concurrent
+    sessions can register simulations at the same time without losing entries.
+
+    Parameters:
+    - `name` (str): The file name of the version inside `DATA_DIR`, as listed in the Version selector.
+    - `parent` (str, optional): The version the simulation was run on.
+    - `params` (dict, optional): The simulation parameters.
+    - `row_count` (int, optional): The number of rows stored in the file.
+    - `created` (str, optional): The creation time ('YYYY-MM-DD_HH-MM-SS').
+    - `file_format` (str, optional): The format of the file ('csv' or 'delta-parquet'). Derived from the name if
+    not given.
+    """
+    record = {'name': name, 'parent': parent, 'params': None if params is None else json.dumps(params, default=str),
+              'row_count': row_count, 'created': created, 'path': os.path.join(DATA_DIR, name),
+              'format': file_format or ('delta-parquet' if name.endswith(DELTA_SUFFIX) else 'csv')}
+
+    connection = _registry_connection()
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        _insert_simulation(connection, record)
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        connection.execute(f'PRAGMA user_version = {version + 1}')
+        connection.execute('COMMIT')
+    except Exception:
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.close()
+
+
+@profiled()
+def list_simulations():
+    """
+    Description: Lists the registered versions in the order they were added, for the Version selector. The list
+    is cached and only read again when another session has changed the registry.
+
+    Return:
+    - `names` (list): The names of the registered versions.
+    """
+    connection = _registry_connection()
+    try:
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        cached = _registry_listing.get(registry_path())
+        if cached is None or cached[0] != version:
+            names = [row[0] for row in connection.execute('SELECT name FROM simulations ORDER BY rowid')]
+            cached = (version, names)
+            _registry_listing[registry_path()] = cached
+    finally:
+        connection.close()
+    return list(cached[1])
+
+
+def simulation_info(name):
+    """
+    Description: Looks up the registry record of a version by name.
+
+    Parameters:
+    - `name` (str): The name of the version.
+
+    Return:
+    - `info` (dict): The record (`'name'`, `'parent'`, `'params'`, `'row_count'`, `'created'`, `'path'` and
+    `'format'`), or None if the version is not registered.
+    """
+    connection = _registry_connection()
+    connection.row_factory = sqlite3.Row
+    try:
+        row = connection.execute('SELECT * FROM simulations WHERE name = ?', (name,)).fetchone()
+    finally:
+        connection.close()
+
+    if row is None:
+        return None
+    info = dict(row)
+    info['params'] = None if info['params'] is None else json.loads(info['params'])
+    return info
+
+
+def child_simulations(parent):
+    """
+    Description: Lists the simulations saved from a version.
+
+    Parameters:
+    - `parent` (str): The name of the parent version.
+
+    Return:
+    - `names` (list): The names of the simulations, in the order they were added.
+    """
+    connection = _registry_connection()
+    try:
+        rows = connection.execute('SELECT name FROM simulations WHERE parent = ? ORDER BY rowid', (parent,))
+        return [row[0] for row in rows]
+    finally:
+        connection.close()
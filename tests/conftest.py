@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import etl
+from modules import module as mod
+
+
+PRODUCTS = [('FUR-BO-10001798', 'Furniture', 'Bookcases', 'Bush Somerset Collection Bookcase'),
+            ('FUR-CH-10000454', 'Furniture', 'Chairs', 'Hon Deluxe Fabric Upholstered Stacking Chairs'),
+            ('OFF-LA-10000240', 'Office Supplies', 'Labels', 'Self-Adhesive Address Labels'),
+            ('OFF-ST-10000760', 'Office Supplies', 'Storage', 'Eldon Fold N Roll Cart System'),
+            ('TEC-PH-10002275', 'Technology', 'Phones', 'Mitel 5320 IP Phone VoIP phone')]
+CUSTOMERS = [('CG-12520', 'Claire Gute', 'Consumer'),
+             ('DV-13045', 'Darrin Van Huff', 'Corporate'),
+             ('SO-20335', "Sean O'Donnell", 'Consumer'),
+             ('BH-11710', 'Brosina Hoffman', 'Home Office')]
+GEOGRAPHY = [('Henderson', 'Kentucky', 42420, 'South'),
+             ('Los Angeles', 'California', 90036, 'West'),
+             ('Fort Lauderdale', 'Florida', 33311, 'South'),
+             ('Concord', 'North Carolina', 28027, 'South')]
+SHIP_MODES = ['First Class', 'Second Class', 'Standard Class', 'Same Day']
+
+
+def raw_orders(n, seed=0, first_row_id=1, start='2016-01-01', end='2017-12-31', products=PRODUCTS):
+    # Synthetic rows of the raw Superstore export, two order lines per order
+    rng = np.random.default_rng(seed)
+    n_orders = (n + 1) // 2
+    order = np.arange(n) // 2
+
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days
+    order_dates = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days + 1, n_orders), unit='D')
+    ship_dates = order_dates + pd.to_timedelta(rng.integers(0, 7, n_orders), unit='D')
+    customers = rng.integers(0, len(CUSTOMERS), n_orders)
+    geography = rng.integers(0, len(GEOGRAPHY), n_orders)
+    ship_modes = rng.integers(0, len(SHIP_MODES), n_orders)
+    products_ = rng.integers(0, len(products), n)
+
+    sales = np.round(rng.uniform(5, 1000, n), 2)
+    return pd.DataFrame({
+        'Row ID': np.arange(first_row_id, first_row_id + n),
+        'Order ID': [f'CA-{date.year}-{first_row_id + i:06d}' for i, date in enumerate(order_dates[order])],
+        'Order Date': [f'{date.month}/{date.day}/{date.year}' for date in order_dates[order]],
+        'Ship Date': [f'{date.month}/{date.day}/{date.year}' for date in ship_dates[order]],
+        'Ship Mode': [SHIP_MODES[i] for i in ship_modes[order]],
+        'Customer ID': [CUSTOMERS[i][0] for i in customers[order]],
+        'Customer Name': [CUSTOMERS[i][1] for i in customers[order]],
+        'Segment': [CUSTOMERS[i][2] for i in customers[order]],
+        'Country': 'United States',
+        'City': [GEOGRAPHY[i][0] for i in geography[order]],
+        'State': [GEOGRAPHY[i][1] for i in geography[order]],
+        'Postal Code': [GEOGRAPHY[i][2] for i in geography[order]],
+        'Region': [GEOGRAPHY[i][3] for i in geography[order]],
+        'Product ID': [products[i][0] for i in products_],
+        'Category': [products[i][1] for i in products_],
+        'Sub-Category': [products[i][2] for i in products_],
+        'Product Name': [products[i][3] for i in products_],
+        'Sales': sales,
+        'Quantity': rng.integers(1, 10, n),
+        'Discount': rng.choice([0.0, 0.1, 0.2, 0.5], n),
+        'Profit': np.round(sales * rng.uniform(-0.3, 0.4, n), 4),
+    })
+
+
+def write_raw(df, path):
+    df.to_csv(path, index=False, encoding=etl.SOURCE_ENCODING)
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # An empty data folder with its own store, so the tests never touch ./data
+    monkeypatch.setattr(mod, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(mod, 'STORE_DIR', str(tmp_path / '.store'))
+    monkeypatch.setattr(mod, '_shared_categories', {})
+    monkeypatch.setattr(mod, '_dimension_cache', {})
+    return tmp_path
+
+
+@pytest.fixture
+def version(store):
+    # A small version built by the ETL, with its product encoding map
+    source = write_raw(raw_orders(200), store / 'raw.csv')
+    etl.run_etl(source, str(store / 'Baseline.csv'), str(store / 'product_encoding.csv'))
+    return 'Baseline.csv'
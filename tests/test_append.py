@@ -0,0 +1,62 @@
+import pandas as pd
+import pyarrow.dataset as ds
+import pytest
+
+from modules import etl
+from modules import module as mod
+
+from tests.conftest import PRODUCTS, raw_orders, write_raw
+
+
+NEW_PRODUCT = ('TEC-AC-10003832', 'Technology', 'Accessories', 'Logitech P710e Mobile Speakerphone')
+
+
+def derived_data(file_name):
+    # The frame, the stored cube and the partitioned copy of a version
+    cube = mod.version_cube(file_name)[0]
+    mod.partition_version(file_name)
+    partitions = ds.dataset(mod.partition_path(file_name), format='parquet', partitioning='hive').to_table()
+    partitions = partitions.to_pandas().sort_values('Row ID', ignore_index=True)
+    # The dictionaries of the partition files are merged in file order, compare the values
+    partitions = partitions.astype({col: object for col in partitions.columns
+                                    if isinstance(partitions[col].dtype, pd.CategoricalDtype)})
+    return mod.load_version(file_name), pd.read_parquet(mod.cube_path(file_name)), cube, partitions
+
+
+def test_append_matches_full_rebuild(version, store, monkeypatch):
+    encoding_map = str(store / 'product_encoding.csv')
+    codes = etl.read_encoding_map(encoding_map)
+    derived_data(version)  # the stored cube and partitions are refreshed in part by the append
+
+    # Orders before the last date of the version and in a new year, with a new product
+    batch = raw_orders(40, seed=1, first_row_id=201, start='2017-06-01', end='2018-03-31',
+                       products=PRODUCTS + [NEW_PRODUCT])
+    months = etl.append_batch(write_raw(batch, store / 'batch.csv'), version, encoding_map)
+    appended = derived_data(version)
+
+    assert months == sorted(pd.to_datetime(batch['Order Date']).dt.strftime('%Y-%m').unique().tolist())
+    assert len(appended[0]) == 240
+
+    # Existing products keep their codes, the new one gets the next code
+    new_codes = etl.read_encoding_map(encoding_map)
+    assert {name: new_codes[name] for name in codes} == codes
+    assert new_codes[NEW_PRODUCT[3]] == str(len(codes)).zfill(5)
+    new_rows = appended[0][appended[0]['Product Name'] == NEW_PRODUCT[3]]
+    assert (new_rows['Product PK'].astype(str) == NEW_PRODUCT[0] + '-' + new_codes[NEW_PRODUCT[3]]).all()
+
+    # Convert the appended CSV again into an empty store
+    monkeypatch.setattr(mod, 'STORE_DIR', str(store / '.rebuilt'))
+    monkeypatch.setattr(mod, '_version_cache', {})
+    monkeypatch.setattr(mod, '_shared_categories', {})
+    monkeypatch.setattr(mod, '_dimension_cache', {})
+    rebuilt = derived_data(version)
+
+    for actual, expected in zip(appended, rebuilt):
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_append_rejects_used_row_ids(version, store):
+    batch = raw_orders(4, seed=2, first_row_id=199)
+    with pytest.raises(ValueError, match='Row IDs already used'):
+        etl.append_batch(write_raw(batch, store / 'batch.csv'), version, str(store / 'product_encoding.csv'))
+    assert len(mod.load_version(version)) == 200
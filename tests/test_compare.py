@@ -0,0 +1,15 @@
+import pandas as pd
+import pytest
+
+from modules import module as mod
+
+
+def test_alignment_rejects_duplicate_row_ids(version, store):
+    df = pd.read_csv(store / version, dtype={'Product_encoded': 'str'})
+    df.loc[10, 'Row ID'] = df.loc[11, 'Row ID']
+    df.to_csv(store / 'Duplicated.csv', index=False)
+
+    with pytest.raises(ValueError, match=r"Row IDs used more than once in 'Duplicated.csv'.*\[12\]"):
+        mod.version_alignment(version, 'Duplicated.csv')
+    with pytest.raises(ValueError, match='Row IDs used more than once'):
+        mod.version_diff('Duplicated.csv', version)
@@ -0,0 +1,60 @@
+import math
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import module as mod
+
+
+SPECIAL_VALUES = [0.0, -0.0, np.nan, np.inf, -np.inf, 0.005, -0.005, 1.005, -1.005, 2.675, 0.125, 0.135,
+                  -0.001, 1e-12, -1e-12, 1e15, -1e15, 5e-324]
+
+
+def ceil_lambda(x):
+    # The per-cell rounding used by the app before `round_cents`
+    return math.ceil(x * 100) / 100 if pd.notna(x) and np.isfinite(x) else x
+
+
+def half_up_decimal(x):
+    # The rounding of the `01_preliminary_etl` notebook
+    if not np.isfinite(x):
+        return x
+    return float(Decimal(str(x)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+
+@pytest.fixture(scope='module')
+def values():
+    rng = np.random.default_rng(0)
+    random = np.concatenate([rng.normal(0, 1000, 20000),
+                             rng.uniform(-10, 10, 20000),
+                             np.round(rng.uniform(-1000, 1000, 20000), 3),  # many ties at half a cent
+                             np.round(rng.uniform(-1000, 1000, 20000), 2)])
+    return np.concatenate([random, SPECIAL_VALUES])
+
+
+def assert_bit_identical(actual, expected):
+    # Compares the bit patterns, so -0.0 differs from 0.0 and NaN must be the same NaN
+    actual, expected = np.asarray(actual, dtype='float64'), np.asarray(expected, dtype='float64')
+    np.testing.assert_array_equal(actual.view('i8'), expected.view('i8'))
+
+
+def test_ceil_matches_lambda(values):
+    expected = [ceil_lambda(x) for x in values]
+    assert_bit_identical(mod.round_cents(values), expected)
+
+
+def test_half_up_matches_decimal(values):
+    expected = [half_up_decimal(x) for x in values]
+    assert_bit_identical(mod.round_cents(values, 'half_up'), expected)
+
+
+def test_shape_is_kept():
+    block = np.array([[1.001, -0.0], [np.nan, 2.5]])
+    assert mod.round_cents(block).shape == block.shape
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        mod.round_cents([1.0], 'floor')
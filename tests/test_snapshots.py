@@ -0,0 +1,75 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from modules import module as mod
+
+
+SPEC = {'List Price': ('Increase in %', 10), 'Discount': ('Max Treshold %', 20)}
+
+
+def simulate(file_name, positions, spec=SPEC):
+    # The full simulated data and the simulated rows, as the app builds them
+    df = mod.load_version(file_name)
+    rows = mod.run_simulation(df.take(positions), spec)
+    return mod.insert_changes(df, rows, mod.version_row_index(file_name)), rows
+
+
+def snapshot_rows(name):
+    return pq.ParquetFile(mod.DATA_DIR + '/' + name).metadata.num_rows
+
+
+def test_delta_snapshot_loads_like_full_save(version):
+    full, rows = simulate(version, range(0, 200, 3))
+
+    delta_name = mod.save_simulation(rows, 'rows', version, {'spec': 'rows'})
+    full_name = mod.save_simulation(full, 'full', version, {'spec': 'full'})
+
+    pd.testing.assert_frame_equal(mod.load_version(delta_name), full)
+    pd.testing.assert_frame_equal(mod.load_version(full_name), full)
+
+    # Saving the full data only stores the changed rows too
+    changed = (full[mod.SIMULATION_COLUMNS] != mod.load_version(version)[mod.SIMULATION_COLUMNS]).any(axis=1)
+    assert snapshot_rows(delta_name) == snapshot_rows(full_name) == changed.sum()
+    info = mod.read_snapshot_info(delta_name)
+    assert (info['parent'], info['params']) == (version, {'spec': 'rows'})
+
+
+def test_chained_snapshots(version):
+    first, rows = simulate(version, range(0, 100))
+    first_name = mod.save_simulation(rows, 'first', version)
+
+    second, rows = simulate(first_name, range(50, 150), {'COGS': ('Increase in %', -5)})
+    second_name = mod.save_simulation(rows, 'second', first_name)
+
+    assert mod.read_snapshot_info(second_name)['parent'] == first_name
+    pd.testing.assert_frame_equal(mod.load_version(first_name), first)
+    pd.testing.assert_frame_equal(mod.load_version(second_name), second)
+
+    # Rows changed by the first snapshot only keep its values
+    pd.testing.assert_frame_equal(mod.load_version(second_name).iloc[:50], first.iloc[:50])
+
+
+def test_empty_simulation(version):
+    baseline = mod.load_version(version)
+
+    empty_name = mod.save_simulation(baseline.iloc[:0], 'empty', version)
+    unchanged_name = mod.save_simulation(baseline.iloc[:20], 'unchanged', version)
+
+    assert snapshot_rows(empty_name) == snapshot_rows(unchanged_name) == 0
+    pd.testing.assert_frame_equal(mod.load_version(empty_name), baseline)
+    pd.testing.assert_frame_equal(mod.load_version(unchanged_name), baseline)
+
+
+def test_snapshot_skips_unknown_row_ids(version):
+    full, rows = simulate(version, range(10))
+    name = mod.save_simulation(rows, 'unknown', version)
+
+    # A changed row whose Row ID is not in the parent must not be written over another row
+    path = mod.DATA_DIR + '/' + name
+    table = pq.read_table(path)
+    extra = table.slice(0, 1).to_pandas().assign(**{'Row ID': 10 ** 6})
+    table = pa.concat_tables([table, pa.Table.from_pandas(extra, schema=table.schema, preserve_index=False)])
+    pq.write_table(table, path)
+
+    pd.testing.assert_frame_equal(mod.load_version(name), full)
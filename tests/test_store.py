@@ -0,0 +1,48 @@
+import pandas as pd
+import pyarrow as pa
+
+from modules import module as mod
+
+
+def read_flat(file_name):
+    # The flat table of a version, read from its CSV like `convert_version` does
+    path = mod.DATA_DIR + '/' + file_name
+    header = pd.read_csv(path, nrows=0).columns
+    df = pd.read_csv(path, dtype={col: 'str' for col, dtype in mod.VERSION_DTYPES.items()
+                                  if col in header and dtype == 'category'},
+                     parse_dates=[col for col in mod.VERSION_DATE_COLUMNS if col in header])
+    df = mod.apply_version_schema(df)
+    return df.sort_values(mod.TIME_COLUMN, kind='stable', ignore_index=True)
+
+
+def test_join_dimensions_rebuilds_flat_table(version):
+    flat = read_flat(version)
+    fact, info = mod.normalize_version(flat)
+
+    # Only the Row ID, the measures and the keys are left in the fact table
+    assert set(mod.STAR_KEYS.values()) <= set(fact.columns)
+    assert not set(fact.columns) & {col for _, attributes in mod.STAR_DIMENSIONS.values() for col in attributes}
+
+    table = pa.Table.from_pandas(fact, preserve_index=False)
+    rebuilt = mod.join_dimensions(table, info['dimensions'], info['columns']).to_pandas()
+    pd.testing.assert_frame_equal(rebuilt, flat, check_exact=True)
+
+
+def test_load_version_matches_flat_table(version):
+    pd.testing.assert_frame_equal(mod.load_version(version), read_flat(version), check_exact=True)
+
+
+def test_conflicting_attributes_stay_in_fact_table(version, store):
+    mod.convert_version(version)  # fills the shared dimension tables
+
+    # Same orders, customers and products, with other attributes for some of them
+    df = pd.read_csv(store / version, dtype={'Product_encoded': 'str'})
+    df.loc[::7, 'Ship Mode'] = 'Same Day'
+    df.loc[df['Customer ID'] == 'CG-12520', 'Customer Name'] = 'Claire Gute-Smith'
+    df.loc[::5, 'Product Name'] = 'Renamed product'
+    df.to_csv(store / 'Changed.csv', index=False)
+
+    fact = mod.normalize_version(read_flat('Changed.csv'))[0]
+    assert {'Ship Mode', 'Customer Name', 'Product Name'} <= set(fact.columns)
+    assert 'Segment' not in fact.columns
+    pd.testing.assert_frame_equal(mod.load_version('Changed.csv'), read_flat('Changed.csv'), check_exact=True)
@@ -0,0 +1,85 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import module as mod
+
+
+SPEC = {'List Price': ('Increase in %', 7), 'Discount': ('Max Treshold %', 10), 'COGS': ('Increase in %', 3)}
+
+
+def views(df):
+    # Filters of the Selection table: Order Year x Category x Region, each with 'All'
+    options = [['All'] + sorted(df[col].unique().tolist()) for col in ['Order Year', 'Category', 'Region']]
+    for year, category, region in itertools.product(*options):
+        yield [('Order Year', year), ('Category', category), ('Region', region)]
+
+
+def filtered(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    for col, selector in filters:
+        if selector != 'All':
+            mask &= (df[col] == selector).to_numpy()
+    return df[mask]
+
+
+def assert_cents_close(actual, expected):
+    # Sums in another order differ in the last bits, which rounding up to cents can turn into one cent
+    np.testing.assert_array_less(np.abs(actual.to_numpy() - expected.to_numpy()), 0.01 + 1e-9)
+
+
+@pytest.fixture
+def rows(version):
+    return mod.load_version(version)
+
+
+def test_cube_totals_match_row_totals(version, rows):
+    for filters in views(rows):
+        expected = mod.summary_totals(filtered(rows, filters), 'Baseline', 'All')
+        actual = mod.cube_totals(version, filters, 'Baseline')
+
+        assert list(actual.index) == list(expected.index)
+        if expected.empty:
+            continue
+        assert actual['Quantity'].iloc[0] == expected['Quantity'].iloc[0]
+        np.testing.assert_allclose(actual[mod.SUMMARY_MEASURES].to_numpy(dtype='float64'),
+                                   expected[mod.SUMMARY_MEASURES].to_numpy(dtype='float64'), rtol=1e-12)
+        assert_cents_close(mod.summary_metrics(actual), mod.summary_metrics(expected))
+
+
+def test_selection_totals_of_a_period_sum_the_rows(version, rows):
+    index = mod.version_time_index(version)
+    period = mod.period_rows(index, 'Q2', 2017)
+    for filters in views(rows):
+        expected = mod.summary_totals(filtered(rows.iloc[slice(*period)], filters), 'Baseline', 'All')
+        actual = mod.selection_totals(version, filters, 'Baseline', period)
+        pd.testing.assert_frame_equal(actual, expected, check_exact=True, check_index_type=False,
+                                      check_dtype=not expected.empty)
+
+
+def test_simulated_totals_within_one_cent(version, rows):
+    index = mod.version_dimension_index(version)
+    for filters in views(rows):
+        positions = mod.dimension_positions(index, filters)
+        if not len(positions):
+            continue
+        overlay = mod.simulation_overlay(version, positions, SPEC)
+        simulated = mod.read_overlay(overlay)
+
+        # The Selection table sums the simulated rows, like the app did on the simulated data
+        expected = mod.summary_totals(simulated, 'Simulation', 'All')
+        pd.testing.assert_frame_equal(mod.overlay_totals(overlay), expected, check_exact=True)
+
+        # Adding the change to the cube totals gives the same measures, up to one cent once rounded
+        change = mod.overlay_change(overlay)
+        actual = mod.apply_totals_change(mod.cube_totals(version, filters, 'Baseline'), change, 'Simulation')
+        np.testing.assert_allclose(actual[mod.SUMMARY_MEASURES].to_numpy(dtype='float64'),
+                                   expected[mod.SUMMARY_MEASURES].to_numpy(dtype='float64'), rtol=1e-12)
+        assert_cents_close(mod.summary_metrics(actual), mod.summary_metrics(expected))
+
+        # The whole version with the simulated rows, as in the Total Business view
+        total = mod.summary_totals(mod.read_overlay(overlay, full=True), 'Simulation', 'All')
+        actual = mod.apply_totals_change(mod.cube_totals(version, [], 'Baseline'), change, 'Simulation')
+        assert_cents_close(mod.summary_metrics(actual), mod.summary_metrics(total))